@@ -18,10 +18,13 @@ from core.mappings import add_field_alias
 import core.mappings as mp
 from core.mappings import add_value_alias, remove_value_alias  # если у вас отдельный модуль values — импортируйте его как раньше
 from templates_ai import answer_via_templates
-from templates_store import add_alias as add_tpl_alias
+from templates_store import add_alias as add_tpl_alias, warm_count_tables
 import logging
 from datetime import datetime
-from config import LOGS_DIR
+from config import LOGS_DIR, LAZY_LOAD, WATCH_DATA, REPL_ISOLATION, COUNT_TABLES
+from data.watcher import start_watcher
+from engine.sandbox import get_pool as get_sandbox_pool, cancel_all
+from engine.result import handle_result_command
 
 SESSION_LOG = os.path.join(LOGS_DIR, f"cli_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
 logging.basicConfig(
@@ -82,12 +85,19 @@ def handle_accept_value_suggestion(q: str) -> str | None:
 def main():
     global DFS_REG
     user_rules = rules_io.load_rules()
-    dfs = load_dataframes()
+    dfs = load_dataframes(lazy=LAZY_LOAD)
     DFS_REG = dfs
     register_dataframes(dfs)
+    if COUNT_TABLES:
+        # Индексы значений для count-шаблонов (только по уже загруженным сущностям)
+        warm_count_tables(dfs)
     G = load_graph()
     if G is not None:
         register_graph(G)
+    if WATCH_DATA:
+        start_watcher(dfs)
+    if REPL_ISOLATION != "off":
+        get_sandbox_pool()
 
     print("🤖 Assistant: структурные запросы активны. RAG отключён.")
 
@@ -100,6 +110,10 @@ def main():
         msg = handle_accept_value_suggestion(q)
         if msg: print(msg); continue
 
+        # страницы/экспорт последнего результата (без повторного исполнения)
+        msg = handle_result_command(q)
+        if msg: print(msg); continue
+
         state.LastQuestion = q
         try:
             text, sugg = answer_via_templates(q, DFS_REG)
@@ -108,5 +122,9 @@ def main():
             state.LastAnswer = text
             state.remember_exchange(q, text)
             print("\n📌 Ответ:", text)
+        except KeyboardInterrupt:
+            # Ctrl+C во время ответа: текущий код прерывается (воркер пула убивается), сессия продолжается
+            cancel_all()
+            print("\n⏹ Запрос прерван.")
         except Exception as e:
             print(f"⚠ Ошибка обработки: {e}")
\ No newline at end of file
@@ -6,11 +6,11 @@ VENV_PYTHON = os.path.join(BASE_DIR, "rag_env", "Scripts", "python.exe")
 if SCRIPTS_DIR not in sys.path:
     sys.path.insert(0, SCRIPTS_DIR)
 
-from templates_store import list_templates, get_template, add_alias, add_template as store_add_template, run_template as store_run_template
+from templates_store import list_templates, get_template, add_alias, add_template as store_add_template, run_template as store_run_template, warm_count_tables
 from templates_ai import answer_via_templates, generate_template_with_llm
 
 # -*- coding: utf-8 -*-
-import subprocess, threading, traceback, io, html, math
+import subprocess, threading, traceback, io, html, math, multiprocessing
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QTabWidget, QTextEdit, QScrollArea, QFrame, QSizePolicy
@@ -21,7 +21,7 @@ import re
 from core.mappings import add_value_alias
 import logging, traceback
 from datetime import datetime
-from config import LOGS_DIR
+from config import LOGS_DIR, LAZY_LOAD, WATCH_DATA, REPL_ISOLATION, COUNT_TABLES
 from engine.repl import register_dataframes, register_graph
 
 SESSION_LOG = os.path.join(LOGS_DIR, f"gui_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
@@ -67,21 +67,36 @@ from data.loader import load_dataframes
 from engine.router import try_quick_count, try_quick_list
 from engine.repl import register_dataframes
 from graph.tool import load_graph
+from data.watcher import start_watcher
+from engine.sandbox import get_pool as get_sandbox_pool, cancel_all as cancel_autocode
+from engine.result import handle_result_command
 
 DFS_REG = None
+DATA_WATCHER = None
 def init_assistant():
-    global DFS_REG
-    dfs = load_dataframes()
+    global DFS_REG, DATA_WATCHER
+    dfs = load_dataframes(lazy=LAZY_LOAD)
     DFS_REG = dfs
     register_dataframes(dfs)
+    if COUNT_TABLES:
+        # Индексы значений для count-шаблонов (только по уже загруженным сущностям)
+        warm_count_tables(dfs)
     G = load_graph()
     if G is not None:
         register_graph(G)
-
-try:
-    init_assistant()
-except Exception as e:
-    print("Ошибка инициализации ассистента:", e)
+    if WATCH_DATA:
+        # Перезагрузка изменённых CSV в фоне: чат не блокируется
+        DATA_WATCHER = start_watcher(dfs, on_reload=lambda name, kind: print(f"🔄 Данные обновлены: {name} ({kind})"))
+    if REPL_ISOLATION != "off":
+        # Прогрев пула воркеров после регистрации данных (fork унаследует df_*/G)
+        get_sandbox_pool()
+
+# Воркеры пула загрузки CSV (spawn) повторно импортируют этот модуль — данные им не нужны
+if multiprocessing.parent_process() is None:
+    try:
+        init_assistant()
+    except Exception as e:
+        print("Ошибка инициализации ассистента:", e)
 
 
 def as_rich_wrapped_bot(text: str) -> str:
@@ -277,8 +292,12 @@ class ChatTab(QWidget):
         self.entry.setFont(QFont("Segoe UI Emoji", 11))
         send_btn = QPushButton("Отправить")
         send_btn.clicked.connect(self.send_query)
+        stop_btn = QPushButton("⏹ Прервать")
+        stop_btn.setToolTip("Остановить выполняющийся код запроса")
+        stop_btn.clicked.connect(self.cancel_query)
         entry_layout.addWidget(self.entry)
         entry_layout.addWidget(send_btn)
+        entry_layout.addWidget(stop_btn)
         layout.addLayout(entry_layout)
 
         self.setLayout(layout)
@@ -326,6 +345,10 @@ class ChatTab(QWidget):
 
         def worker():
             try:
+                msg = handle_result_command(q)
+                if msg:
+                    self.answer_ready.emit(msg)
+                    return
                 text, sugg = answer_via_templates(q, DFS_REG)
                 if sugg:
                     if sugg.get("kind") == "save_alias" and state.LastSuggestion.get("kind") == "value":
@@ -341,6 +364,13 @@ class ChatTab(QWidget):
 
         threading.Thread(target=worker, daemon=True).start()
 
+    def cancel_query(self):
+        if cancel_autocode():
+            self.log_debug("[UI] Прерывание выполнения кода")
+        else:
+            self.chat_widget.add_message("bot", "ℹ Прерывание доступно только при REPL_ISOLATION (код в отдельных процессах).")
+            self._scroll_to_bottom()
+
     def on_answer_ready(self, answer: str):
         self.log_debug(f"[UI] Отрисовка ответа: {repr(answer)[:200]}...")
         self._remove_suggestion_button()
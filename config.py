@@ -18,6 +18,7 @@ META_PATH = os.path.join(VECT_DIR, "vect_meta.json")
 MODEL_PATH = os.path.join(BASE_DIR, "models", "qwen2-7b-instruct-q4_k_m.gguf")
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
 SCRIPTS_DIR = os.path.join(BASE_DIR, "scripts")
+EXPORTS_DIR = os.path.join(BASE_DIR, "exports")
 
 RULES_FILE = os.path.join(SCRIPTS_DIR, "rules.json")
 PROMPT_EXAMPLES = os.path.join(SCRIPTS_DIR, "prompt_examples.txt")
@@ -33,6 +34,87 @@ VALUE_MAPPINGS_FILE = os.path.join(SCRIPTS_DIR, "value_mappings_user.json")
 # RAG — отключён по умолчанию
 ENABLE_RAG = False
 
+# Кэш CSV в колоночном формате (Feather/Arrow IPC, без pyarrow — pickle)
+ENABLE_DATA_CACHE = True
+DATA_CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+
+# Параллельная загрузка CSV: "process" (с откатом на потоки) | "thread" | "off"
+LOAD_POOL = "process"
+LOAD_WORKERS = 0   # 0 = по числу ядер (но не больше числа файлов)
+
+# Компактная загрузка: малокардинальные строковые колонки → pandas Categorical.
+# По умолчанию выключена: value_counts/groupby по Categorical отличаются от object (автокод LLM)
+LOAD_COMPACT = False
+COMPACT_MIN_ROWS = 1000
+COMPACT_REF_MAX_RATIO = 0.5   # *_Наименование/*_GUID ссылочных полей из описание.txt
+COMPACT_MAX_RATIO = 0.1       # прочие колонки: доля уникальных значений
+# Уникальные GUID-колонки → string[pyarrow] (один буфер вместо объекта str на значение);
+# работает и при LOAD_COMPACT = False
+GUID_COMPACT = True
+
+# Общий снимок данных (Arrow IPC + manifest.json), открывается всеми процессами через mmap
+USE_SNAPSHOT = True
+SNAPSHOT_DIR = os.path.join(DATA_DIR, ".snapshot")
+# Строковые колонки из снимка: "arrow" — string[pyarrow] прямо поверх отображения (одна копия на все
+# процессы и воркеры пула; маски сравнения — bool[pyarrow]); "object" — своя копия str в каждом процессе
+SNAPSHOT_STRINGS = "arrow"
+
+# Проекция: читать только GUID/Наименование и ссылочные колонки из описание.txt (+ доп. колонки по сущностям)
+LOAD_PROJECTION = False
+LOAD_PROJECTION_EXTRA = {}    # {"Документы": ["Дата", "Сумма"]}
+# Большие файлы читаются частями и сразу сжимаются — пик памяти ~ один кусок + компактный результат
+LOAD_CHUNK_MB = 256           # 0 = всегда целиком
+LOAD_CHUNK_ROWS = 200_000
+
+# Ленивая загрузка: сущность читается при первом обращении (router, шаблоны, exec)
+LAZY_LOAD = True
+LAZY_MEMORY_BUDGET_MB = 0     # 0 = без вытеснения; иначе редко используемые сущности выгружаются
+
+# Кэш скомпилированного кода python_repl_tool (LRU по хэшу исходника)
+REPL_CODE_CACHE_SIZE = 512
+# Кэш результатов автокода: ключ — нормализованный код + версии данных упомянутых df_*/G (0 = выключен)
+REPL_RESULT_CACHE_SIZE = 256
+
+# Изоляция автокода в пуле процессов: "off" | "templates" (код шаблонов tpl_store/LLM) | "all"
+REPL_ISOLATION = "off"
+REPL_WORKERS = 2
+REPL_TIMEOUT_SEC = 30
+REPL_MEMORY_MB = 1024         # потолок прироста памяти воркера на запуск (0 = без лимита)
+REPL_START_METHOD = "auto"    # "auto" (forkserver, где есть, иначе spawn) | "fork" (только без фоновых потоков) | "spawn" | "forkserver"
+# Размер страницы результата автокода (!дальше — следующая, !экспорт — целиком в EXPORTS_DIR)
+REPL_PAGE_SIZE = 50
+# Профиль исполнения автокода/планов в JSONL (время, CPU, пик памяти tracemalloc — заметно замедляет всё приложение)
+# Сводка: python -m engine.profile summary
+REPL_PROFILE = False
+REPL_PROFILE_FILE = os.path.join(LOGS_DIR, "repl_profile.jsonl")
+REPL_PROFILE_MAX_MB = 20
+REPL_PROFILE_BACKUPS = 3
+
+# Инвертированный индекс значений (значение → позиции строк) для фильтров «поле = значение»;
+# строится лениво на (сущность, колонка), сбрасывается при перезагрузке данных
+VALUE_INDEX = True
+VALUE_INDEX_MAX = 64          # сколько колонок держать (LRU)
+# Сверка каждого исполненного плана с обычной pandas-маской (отладка; расхождение — в лог [CODE.PLAN.MISMATCH])
+PLAN_VERIFY = False
+# Count-шаблоны tpl_store (по bindings) отвечают по частотам индекса значений, без прохода по DataFrame
+COUNT_TABLES = True
+# Подготовленные колонки для поиска значений (строковый вид, уникальные в casefold) — LRU по (сущность, колонка)
+PREPARED_COLUMNS_MAX = 64
+# Подсказки значений (rapidfuzz): ниже порога вариант не предлагается (0 — как раньше, top-N любых);
+# workers — потоки cdist для больших колонок (-1 — все ядра)
+VALUE_FUZZY_SCORE_CUTOFF = 0
+VALUE_FUZZY_WORKERS = -1
+# Триграммный префильтр для нечёткого поиска по большим колонкам (и именам узлов графа):
+# при числе различных значений от FUZZY_NGRAM_MIN_CHOICES точный WRatio считается только по
+# FUZZY_NGRAM_CANDIDATES значениям с наибольшим числом общих триграмм с запросом.
+# Больше кандидатов — выше полнота, дольше ответ; 0 в FUZZY_NGRAM_MIN_CHOICES — префильтр выключен
+FUZZY_NGRAM_MIN_CHOICES = 50000
+FUZZY_NGRAM_CANDIDATES = 3000
+
+# Горячая перезагрузка ExportedData после выгрузки из 1С (опрос файлов, без OS-уведомлений)
+WATCH_DATA = True
+WATCH_INTERVAL_SEC = 5
+
 os.makedirs(LOGS_DIR, exist_ok=True)
 
 def log_path():
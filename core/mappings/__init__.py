@@ -21,6 +21,7 @@ from .values import (
     add_value_alias,
     remove_value_alias,
     suggest_similar_values,
+    suggest_similar_values_batch,
     list_all,
     dump_values,
 )
@@ -31,5 +32,5 @@ __all__ = [
     # fields
     "unify_field_phrase", "pick_column", "suggest_similar_columns", "add_field_alias", "remove_field_alias", "list_field_aliases",
     # values
-    "resolve_value", "add_value_alias", "remove_value_alias", "suggest_similar_values", "list_all", "dump_values",
+    "resolve_value", "add_value_alias", "remove_value_alias", "suggest_similar_values", "suggest_similar_values_batch", "list_all", "dump_values",
 ]
\ No newline at end of file
@@ -7,6 +7,12 @@ ENTITY_EN2RU = {}
 ENTITY_RU2CANON = {}
 FIELD_RU2CANON = {}
 FIELD_ALIASES = {}
+# Версия карт: растёт при перезагрузке и изменении синонимов полей — по ней сбрасывается кэш разрешения колонок
+MAPS_VERSION = 0
+
+def bump_maps_version():
+    global MAPS_VERSION
+    MAPS_VERSION += 1
 
 def reload_maps():
     global ENTITY_EN2RU, ENTITY_RU2CANON, FIELD_RU2CANON, FIELD_ALIASES
@@ -15,6 +21,7 @@ def reload_maps():
     ENTITY_RU2CANON = d["entity_ru2canon"]
     FIELD_RU2CANON = d["field_ru2canon"]
     FIELD_ALIASES = d["field_aliases"]
+    bump_maps_version()
 
 def save_maps():
     save_all(ENTITY_EN2RU, ENTITY_RU2CANON, FIELD_RU2CANON, FIELD_ALIASES)
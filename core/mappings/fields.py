@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
-from typing import Optional, List, Tuple
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, List, Tuple
+import numpy as np
 import pandas as pd
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+from . import entities as _maps
 from .entities import reload_maps, save_maps, FIELD_RU2CANON, FIELD_ALIASES
 from .utils import clean_term, is_guid_col
 
@@ -15,32 +19,72 @@ def unify_field_phrase(text: str) -> Optional[str]:
         return FIELD_RU2CANON[t]
     return None
 
+class _ColumnResolver:
+    """
+    Разрешение «поле → колонка» для одного набора колонок при одной версии карт синонимов:
+    канонические поля разрешаются сразу, прочие запросы и подсказки запоминаются.
+    """
+    def __init__(self, columns):
+        self.cols = [c for c in columns if not is_guid_col(c)]
+        self.col_set = set(self.cols)
+        self.lower_map = {c.lower(): c for c in self.cols}
+        self.cols_lower = [c.lower() for c in self.cols]
+        self.picks: Dict[str, Optional[str]] = {f: self._pick(f) for f in FIELD_ALIASES}
+        self.suggestions: Dict[Tuple[str, int], List[Tuple[str, int]]] = {}
+
+    def _pick(self, field: str) -> Optional[str]:
+        if f"{field}_Наименование" in self.col_set:
+            return f"{field}_Наименование"
+        if field in self.col_set:
+            return field
+        for a in FIELD_ALIASES.get(field, []):
+            if a.lower() in self.lower_map:
+                return self.lower_map[a.lower()]
+        return None
+
+    def pick(self, field: str) -> Optional[str]:
+        if field not in self.picks:
+            self.picks[field] = self._pick(field)
+        return self.picks[field]
+
+    def suggest(self, field: str, top_n: int) -> List[Tuple[str, int]]:
+        key = (field, top_n)
+        if key not in self.suggestions:
+            bases = [field.lower()] + [str(a).lower() for a in FIELD_ALIASES.get(field, [])]
+            bases = list(dict.fromkeys(bases))
+            if self.cols:
+                # лучшая оценка колонки по всем синонимам поля — одна матрица cdist
+                best = process.cdist(bases, self.cols_lower, scorer=fuzz.WRatio, dtype=np.float64).max(axis=0)
+                order = np.argsort(-best, kind="stable")[:top_n]
+                self.suggestions[key] = [(self.cols[i], int(best[i])) for i in order]
+            else:
+                self.suggestions[key] = []
+        return self.suggestions[key]
+
+# (колонки, версия карт) → _ColumnResolver; LRU
+_RESOLVERS: "OrderedDict[Tuple[tuple, int], _ColumnResolver]" = OrderedDict()
+_RESOLVERS_MAX = 256
+_LOCK = threading.Lock()
+
+def _resolver(df: pd.DataFrame) -> _ColumnResolver:
+    key = (tuple(df.columns), _maps.MAPS_VERSION)
+    with _LOCK:
+        r = _RESOLVERS.get(key)
+        if r is not None:
+            _RESOLVERS.move_to_end(key)
+            return r
+    r = _ColumnResolver(key[0])
+    with _LOCK:
+        _RESOLVERS[key] = r
+        while len(_RESOLVERS) > _RESOLVERS_MAX:
+            _RESOLVERS.popitem(last=False)
+    return r
+
 def pick_column(df: pd.DataFrame, field: str) -> Optional[str]:
-    cols = list(df.columns)
-    cols = [c for c in cols if not is_guid_col(c)]
-    if f"{field}_Наименование" in cols:
-        return f"{field}_Наименование"
-    if field in cols:
-        return field
-    lower_map = {c.lower(): c for c in cols}
-    for a in FIELD_ALIASES.get(field, []):
-        if a.lower() in lower_map:
-            return lower_map[a.lower()]
-    return None
+    return _resolver(df).pick(field)
 
 def suggest_similar_columns(df: pd.DataFrame, field: str, top_n: int = 5) -> List[Tuple[str, int]]:
-    bases = set([field, field.lower()])
-    for a in FIELD_ALIASES.get(field, []):
-        bases.add(str(a)); bases.add(str(a).lower())
-    scored = []
-    for col in list(df.columns):
-        if is_guid_col(col): 
-            continue
-        cl = col.lower()
-        best = max(fuzz.WRatio(cl, b.lower()) for b in bases) if bases else 0
-        scored.append((col, int(best)))
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return scored[:top_n]
+    return list(_resolver(df).suggest(field, top_n))
 
 def add_field_alias(alias: str, canonical: str) -> str:
     a = clean_term(alias)
@@ -49,6 +93,7 @@ def add_field_alias(alias: str, canonical: str) -> str:
     FIELD_ALIASES.setdefault(c, [])
     if a not in FIELD_ALIASES[c]:
         FIELD_ALIASES[c].append(a)
+    _maps.bump_maps_version()
     save_maps()
     return f"✅ Добавлен синоним поля: «{alias}» → «{canonical}» (сохранено)"
 
@@ -62,6 +107,7 @@ def remove_field_alias(canonical: str, alias: str) -> str:
     if low in FIELD_RU2CANON and FIELD_RU2CANON[low] == c:
         del FIELD_RU2CANON[low]; removed = True
     if removed:
+        _maps.bump_maps_version()
         save_maps()
         return f"✅ Удалён синоним поля: «{alias}» из «{canonical}»"
     return f"ℹ Синоним поля «{alias}» для «{canonical}» не найден"
@@ -8,11 +8,18 @@ import json
 import os
 from typing import Optional, Dict, List, Tuple
 
-import pandas as pd
+import numpy as np
 
-from config import VALUE_MAPPINGS_FILE
+from config import (VALUE_MAPPINGS_FILE, VALUE_FUZZY_SCORE_CUTOFF, VALUE_FUZZY_WORKERS,
+                    FUZZY_NGRAM_MIN_CHOICES)
 from core.schema import load_schema, get_ref_dict
 from core.mappings.fields import unify_field_phrase
+from data.columns import PreparedColumn
+
+try:
+    from rapidfuzz import fuzz, process
+except Exception:
+    fuzz = process = None
 
 _STORE: Dict[str, Dict[str, Dict[str, str]]] = {}   # {"_by_dict": {...}}
 _LOADED = False
@@ -145,28 +152,66 @@ def remove_value_alias(entity: str, field: str, alias_value: str) -> str:
         return f"✅ Удалён алиас значения: {ns_key}: «{alias_value}»"
     return f"ℹ Алиас «{alias_value}» не найден для {ns_key}"
 
-def suggest_similar_values(series: pd.Series, asked_value: str, top_n: int = 10) -> List[Tuple[str, int]]:
-    try:
-        from rapidfuzz import fuzz
-        ratio = lambda a,b: int(fuzz.WRatio(a,b))
-    except Exception:
-        ratio = lambda a,b: 0
-    vals = pd.unique(series.fillna("").astype(str))
-    asked = (asked_value or "").strip().lower()
-    scored = []
-    for v in vals:
-        vv = str(v).strip()
-        if not vv: continue
-        scored.append((vv, ratio(vv.lower(), asked)))
-    scored.sort(key=lambda x: x[1], reverse=True)
-    # dedup
-    out, seen = [], set()
-    for val, sc in scored:
-        if val not in seen:
-            out.append((val, sc)); seen.add(val)
-        if len(out) >= top_n: break
+# Меньше пар «запрос × вариант» — один поток через process.extract, больше — cdist на всех ядрах
+_PARALLEL_MIN = 20000
+
+def _top(row: np.ndarray, k: int) -> np.ndarray:
+    """Номера k лучших оценок по убыванию; при равенстве — в порядке вариантов."""
+    if k >= len(row):
+        return np.argsort(-row, kind="stable")
+    kth = np.partition(row, len(row) - k)[len(row) - k]
+    cand = np.flatnonzero(row >= kth)
+    return cand[np.argsort(-row[cand], kind="stable")][:k]
+
+def _rank(asked: List[str], choices: List[str], top_n: int) -> List[List[Tuple[int, int]]]:
+    """[(номер варианта, оценка)] по убыванию для каждого запроса."""
+    cutoff = VALUE_FUZZY_SCORE_CUTOFF or None
+    if len(asked) == 1 and len(choices) < _PARALLEL_MIN:
+        hits = process.extract(asked[0], choices, scorer=fuzz.WRatio, limit=top_n, score_cutoff=cutoff)
+        return [[(i, int(sc)) for _, sc, i in hits]]
+    scores = process.cdist(asked, choices, scorer=fuzz.WRatio, score_cutoff=cutoff,
+                           dtype=np.float64, workers=VALUE_FUZZY_WORKERS)
+    return [[(i, int(row[i])) for i in _top(row, top_n) if cutoff is None or row[i] >= cutoff]
+            for row in scores]
+
+def suggest_similar_values_batch(series, asked_values: List[str], top_n: int = 10) -> List[List[Tuple[str, int]]]:
+    """
+    Подсказки сразу для нескольких значений (параметр-список шаблона) — один вызов cdist.
+    series — pd.Series или подготовленная колонка (data.columns.prepared_column): её labels/folded —
+    уже обработанные варианты, повторно не пересчитываются.
+    На больших колонках (FUZZY_NGRAM_MIN_CHOICES) WRatio считается только по кандидатам
+    триграммного индекса — каждый запрос отдельно.
+    """
+    col = series if isinstance(series, PreparedColumn) else PreparedColumn.from_series(series)
+    asked = [(a or "").strip().casefold() for a in asked_values]
+    if not asked:
+        return []
+    if not col.labels or top_n <= 0:
+        return [[] for _ in asked]
+    if fuzz is None:
+        return [[(v, 0) for v in col.labels[:top_n]] for _ in asked]
+    if not FUZZY_NGRAM_MIN_CHOICES or len(col.folded) < FUZZY_NGRAM_MIN_CHOICES:
+        return [[(col.labels[i], sc) for i, sc in hits] for hits in _rank(asked, col.folded, top_n)]
+    tri = col.trigrams()
+    out = []
+    for q in asked:
+        cand = tri.candidates(q)
+        if cand is None:
+            # ни одной знакомой триграммы (короткий/экзотический запрос) — полный перебор
+            out.append([(col.labels[i], sc) for i, sc in _rank([q], col.folded, top_n)[0]])
+            continue
+        hits = _rank([q], [col.folded[i] for i in cand], top_n)[0]
+        out.append([(col.labels[cand[j]], sc) for j, sc in hits])
     return out
 
+def suggest_similar_values(series, asked_value: str, top_n: int = 10) -> List[Tuple[str, int]]:
+    """
+    Ближайшие значения колонки: [(значение, совпадение %)] по убыванию.
+    series — pd.Series или уже подготовленная колонка (data.columns.prepared_column) —
+    тогда уникальные значения и их casefold не пересчитываются.
+    """
+    return suggest_similar_values_batch(series, [asked_value], top_n)[0]
+
 def list_all() -> List[Tuple[str, str, str, str]]:
     """Плоский список для UI: ("DICT_OR_NSKEY", "", alias, canon)"""
     _ensure_loaded()
@@ -1,4 +1,4 @@
 # -*- coding: utf-8 -*-
-from .loader import load_schema, get_ref_dict, get_name_col, get_guid_col
+from .loader import load_schema, get_ref_dict, get_name_col, get_guid_col, get_ref_columns, get_projection
 
-__all__ = ["load_schema", "get_ref_dict", "get_name_col", "get_guid_col"]
\ No newline at end of file
+__all__ = ["load_schema", "get_ref_dict", "get_name_col", "get_guid_col", "get_ref_columns", "get_projection"]
\ No newline at end of file
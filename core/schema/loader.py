@@ -100,4 +100,27 @@ def get_guid_col(entity: str, canonical_field: str) -> Optional[str]:
     for base, info in ent.items():
         if base.lower() == canonical_field.lower() and info.get("guid_col"):
             return info["guid_col"]
-    return None
\ No newline at end of file
+    return None
+
+def get_ref_columns(entity: str) -> list:
+    """Колонки ссылочных полей сущности (name_col и guid_col) по описанию."""
+    if not _LOADED:
+        load_schema()
+    cols = []
+    for info in (_SCHEMA.get(entity) or {}).values():
+        for key in ("name_col", "guid_col"):
+            if info.get(key):
+                cols.append(info[key])
+    return cols
+
+def get_projection(entity: str, extra: Optional[list] = None) -> Optional[list]:
+    """
+    Колонки, которые реально нужны router/шаблонам: Наименование, GUID и ссылочные поля из описания
+    (+ extra). None — сущности нет в описании, читать всё.
+    """
+    if not _LOADED:
+        load_schema()
+    if entity not in _SCHEMA:
+        return None
+    cols = ["GUID", "Наименование"] + get_ref_columns(entity) + list(extra or [])
+    return list(dict.fromkeys(cols))
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Подготовленные колонки для поиска значений: (сущность, колонка) → PreparedColumn.
+Раньше каждый вопрос заново делал df[col].fillna("").astype(str), а подсказки —
+pd.unique и .lower() по всей колонке. Теперь это строится один раз на версию данных
+(data.version) поверх индекса значений той же колонки (data.index: коды и уникальные
+значения считаются один раз) и общий объект используют роутер (handle_value_with_fuzzy),
+разбор параметров шаблонов (templates_ai) и suggest_similar_values.
+Перед нечётким поиском значение ищется по нормализованному ключу (norm_key: регистр, ё/е,
+лишние пробелы, кавычки) — такие «промахи» не должны стоить полного fuzzy-прохода.
+"""
+import re
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from config import PREPARED_COLUMNS_MAX
+from data import version
+from data.index import ValueIndex, get_index, has_value
+from data.ngrams import TrigramIndex
+
+logger = logging.getLogger("ragos")
+
+_QUOTES = str.maketrans("", "", "\"'«»„“”‘’`")
+_SPACES = re.compile(r"\s+")
+
+def norm_key(value) -> str:
+    """Ключ сравнения без учёта регистра, ё/е, повторных пробелов и кавычек: «Ёлка  "Север"» → елка север."""
+    s = str(value).casefold().replace("ё", "е").translate(_QUOTES)
+    return _SPACES.sub(" ", s).strip()
+
+class PreparedColumn:
+    """
+    Надстройка над индексом значений колонки (ValueIndex):
+    uniques/key_of — различные значения (как у fillna("").astype(str)) — общие с индексом;
+    labels        — непустые значения без краевых пробелов, без повторов (варианты для подсказок);
+    folded        — labels в casefold, в том же порядке;
+    label_codes   — для каждого из uniques номер в labels (-1 — пустое значение).
+    """
+    def __init__(self, idx: ValueIndex, index: pd.Index):
+        self._value_index = idx
+        self.uniques = idx.uniques
+        self.key_of: Dict[str, int] = idx.key_of
+        self.rows = idx.rows
+        self._index = index
+        self._strings: Optional[pd.Series] = None
+        self._trigrams: Optional[TrigramIndex] = None
+        self._norm: Optional[Dict[str, Optional[str]]] = None
+        label_of: Dict[str, int] = {}
+        label_codes = np.full(len(self.uniques), -1, dtype=np.int64)
+        for i, v in enumerate(self.uniques):
+            vv = str(v).strip()
+            if vv:
+                label_codes[i] = label_of.setdefault(vv, len(label_of))
+        self.labels: List[str] = list(label_of)
+        self.folded: List[str] = [v.casefold() for v in self.labels]
+        self.label_codes = label_codes
+
+    @classmethod
+    def from_series(cls, s: pd.Series) -> "PreparedColumn":
+        """Колонка вне кэша (произвольная Series): индекс значений строится тут же."""
+        return cls(ValueIndex(s), s.index)
+
+    @property
+    def n_unique(self) -> int:
+        return len(self.uniques)
+
+    def __contains__(self, value) -> bool:
+        return str(value) in self.key_of
+
+    def normalized(self, value) -> Optional[str]:
+        """Значение колонки с тем же norm_key; None — нет такого или их несколько (тогда решает fuzzy)."""
+        if self._norm is None:
+            norm: Dict[str, Optional[str]] = {}
+            for v in self.uniques:
+                k = norm_key(v)
+                if k:
+                    norm[k] = v if norm.get(k, v) == v else None
+            self._norm = norm
+        return self._norm.get(norm_key(value))
+
+    def trigrams(self) -> TrigramIndex:
+        """Триграммный индекс по folded (строится при первом нечётком поиске, живёт вместе с колонкой)."""
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(self.folded)
+        return self._trigrams
+
+    @property
+    def strings(self) -> pd.Series:
+        """Строковый вид колонки (= df[col].fillna("").astype(str)); собирается из кодов при первом обращении."""
+        if self._strings is None:
+            self._strings = pd.Series(self.uniques[self._value_index.codes()], index=self._index, dtype=object)
+        return self._strings
+
+# (сущность, колонка) → колонка; LRU по PREPARED_COLUMNS_MAX (общая логика — version.EntityCache)
+_COLUMNS = version.EntityCache(PREPARED_COLUMNS_MAX)
+STATS = _COLUMNS.stats
+STATS["norm_hits"] = 0   # сэкономленные fuzzy-проходы
+
+def _build(entity: str, column: str, df: pd.DataFrame) -> PreparedColumn:
+    # Коды и уникальные значения — из индекса значений; при выключенном VALUE_INDEX — разовый индекс
+    idx = get_index(entity, column, df)
+    return PreparedColumn(idx, df.index) if idx is not None else PreparedColumn.from_series(df[column])
+
+def prepared_column(entity: str, column: str, df: pd.DataFrame) -> PreparedColumn:
+    """Подготовленная колонка df (сущность entity) из кэша или построенная заново."""
+    col, ms = _COLUMNS.get(entity, column, df, lambda: _build(entity, column, df))
+    if ms is not None:
+        logger.info("[DATA.COLUMN.BUILD] entity=%s column=%s values=%d rows=%d ms=%.1f",
+                    entity, column, col.n_unique, col.rows, ms)
+    return col
+
+def exact_value(entity: str, df: pd.DataFrame, column: str, value) -> Optional[str]:
+    """
+    Значение для точного фильтра: само value, если оно есть в колонке, иначе значение
+    с тем же нормализованным ключом. None — точного нет, нужен нечёткий поиск.
+    """
+    if has_value(entity, df, column, value):
+        return value
+    found = prepared_column(entity, column, df).normalized(value)
+    if found is not None:
+        with _COLUMNS.lock:
+            STATS["norm_hits"] += 1
+        logger.info("[DATA.COLUMN.NORM] entity=%s column=%s asked=%s -> %s", entity, column, value, found)
+    return found
+
+def prepared_stats() -> dict:
+    with _COLUMNS.lock:
+        return dict(STATS, size=len(_COLUMNS))
+
+def clear_prepared():
+    _COLUMNS.clear()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Компактное хранение DataFrame: повторяющиеся строковые колонки
+(Контрагент_Наименование, Подразделение_Наименование, ...) → pandas Categorical.
+Сравнение `df[col] == "значение"` по-прежнему работает и идёт по целочисленным кодам,
+.tolist()/.astype(str) возвращают обычные строки.
+Режим включается явно (LOAD_COMPACT): value_counts/groupby по Categorical ведут себя иначе,
+чем по object (observed, порядок категорий), и свободный автокод на это не рассчитан.
+Уникальные GUID-колонки (GUID, *_GUID) не кодируются в категории, а хранятся как
+string[pyarrow]: строки остаются строками, но лежат в одном Arrow-буфере.
+Это делается и без LOAD_COMPACT (compact_guids, GUID_COMPACT) — GUID-колонки не участвуют
+в value_counts/groupby автокода, а память занимают больше всех.
+compact_chunks делает то же для потокового чтения: каждый кусок сжимается сразу,
+части колонок склеиваются в конце (union_categoricals для категорий).
+"""
+import importlib.util
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+import pandas as pd
+from pandas.api.types import union_categoricals
+from config import COMPACT_MIN_ROWS, COMPACT_REF_MAX_RATIO, COMPACT_MAX_RATIO, GUID_COMPACT
+from core.schema import get_ref_columns
+from core.mappings.utils import is_guid_col
+
+_GUID_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else None
+
+logger = logging.getLogger("ragos")
+
+def memory_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+def _fmt_mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f}MB"
+
+def _compact_series(col: str, s: pd.Series, limit: float) -> Optional[pd.Series]:
+    """Сжатая версия object-колонки или None, если сжимать не стоит."""
+    if s.dtype != object:
+        return None
+    if s.nunique(dropna=False) <= len(s) * limit:
+        return s.astype("category")
+    if GUID_COMPACT and _GUID_DTYPE and is_guid_col(col):
+        return s.astype(_GUID_DTYPE)
+    return None
+
+def compact_guids(entity: str, df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """Только GUID-колонки → string[pyarrow] (GUID_COMPACT и есть pyarrow); прочие колонки не трогаются."""
+    if not (GUID_COMPACT and _GUID_DTYPE):
+        return df, []
+    converted = [c for c in df.columns if is_guid_col(c) and df[c].dtype == object]
+    for col in converted:
+        df[col] = df[col].astype(_GUID_DTYPE)
+    if converted:
+        logger.info("[DATA.COMPACT.GUID] entity=%s columns=%s", entity, converted)
+    return df, converted
+
+def compact_frame(entity: str, df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Переводит малокардинальные колонки в category.
+    Колонки ссылочных полей из описание.txt берутся с порогом COMPACT_REF_MAX_RATIO,
+    остальные — с более строгим COMPACT_MAX_RATIO.
+    Оставшиеся object-колонки GUID → string[pyarrow] (если доступен pyarrow и GUID_COMPACT).
+    Возвращает (df, отчёт {"before", "after", "columns"}).
+    """
+    rows = len(df)
+    report = {"before": 0, "after": 0, "columns": []}
+    if rows < COMPACT_MIN_ROWS:
+        return df, report
+    report["before"] = memory_bytes(df)
+    ref_cols = set(get_ref_columns(entity))
+    converted: List[str] = []
+    for col in df.columns:
+        limit = COMPACT_REF_MAX_RATIO if col in ref_cols else COMPACT_MAX_RATIO
+        s = _compact_series(col, df[col], limit)
+        if s is not None:
+            df[col] = s
+            converted.append(col)
+    report["after"] = memory_bytes(df) if converted else report["before"]
+    report["columns"] = converted
+    logger.info("[DATA.COMPACT] entity=%s before=%s after=%s columns=%s",
+                entity, _fmt_mb(report["before"]), _fmt_mb(report["after"]), converted)
+    return df, report
+
+def _concat_parts(parts: List[pd.Series]) -> pd.Series:
+    if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+        return pd.Series(union_categoricals(parts), name=parts[0].name)
+    dtypes = {str(p.dtype) for p in parts}
+    if len(dtypes) > 1:
+        # Кусок ушёл в категорию, а соседний нет — приводим к общему виду только эту колонку
+        target = _GUID_DTYPE if _GUID_DTYPE and dtypes <= {_GUID_DTYPE, "category"} else object
+        parts = [p.astype(target) for p in parts]
+    return pd.concat(parts, ignore_index=True)
+
+def compact_chunks(entity: str, chunks: Iterable[pd.DataFrame], compact: bool = True) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Сборка DataFrame из потока кусков. При compact=True каждый кусок сжимается до того,
+    как прочитан следующий, так что пик памяти ≈ один сырой кусок + уже сжатые части.
+    Возвращает (df, отчёт {"before", "after", "columns", "chunks"}).
+    """
+    ref_cols = set(get_ref_columns(entity)) if compact else set()
+    parts: Dict[str, List[pd.Series]] = {}
+    before, n = 0, 0
+    for chunk in chunks:
+        n += 1
+        if compact:
+            before += memory_bytes(chunk)
+        for col in chunk.columns:
+            s = chunk[col].reset_index(drop=True)
+            if compact:
+                limit = COMPACT_REF_MAX_RATIO if col in ref_cols else COMPACT_MAX_RATIO
+                packed = _compact_series(col, s, limit)
+                if packed is not None:
+                    s = packed
+            parts.setdefault(col, []).append(s)
+        del chunk
+    df = pd.DataFrame({col: _concat_parts(p) for col, p in parts.items()})
+    report = {"before": before, "after": 0, "columns": [], "chunks": n}
+    if compact:
+        report["after"] = memory_bytes(df)
+        report["columns"] = [c for c in df.columns if df[c].dtype != object]
+        logger.info("[DATA.COMPACT] entity=%s chunks=%d before=%s after=%s columns=%s",
+                    entity, n, _fmt_mb(before), _fmt_mb(report["after"]), report["columns"])
+    return df, report
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Единое чтение CSV из выгрузки 1С.
+Кодировка и разделитель определяются по первым килобайтам файла
+(BOM → utf-8-sig, валидный UTF-8 → utf-8, иначе cp1251; разделитель — по строке заголовка),
+после чего файл разбирается ровно один раз.
+Очень большие файлы можно читать частями (read_csv_chunks) — каждый кусок сразу сворачивается.
+"""
+import csv
+import codecs
+import logging
+from typing import Callable, Dict, Iterator, Tuple, TypeVar
+import pandas as pd
+
+logger = logging.getLogger("ragos")
+T = TypeVar("T")
+
+SNIFF_BYTES = 64 * 1024
+_SEPARATORS = (";", ",", "\t")
+
+def _sniff_encoding(head: bytes) -> str:
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: хвост выборки может оборвать многобайтовый символ
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+def _sniff_sep(text: str) -> str:
+    header = text.split("\n", 1)[0]
+    counts = {sep: header.count(sep) for sep in _SEPARATORS}
+    best = max(counts, key=counts.get)
+    if counts[best] > 0:
+        return best
+    try:
+        return csv.Sniffer().sniff(text, delimiters="".join(_SEPARATORS)).delimiter
+    except csv.Error:
+        return ";"
+
+def sniff_dialect(path: str) -> Dict[str, str]:
+    """{"encoding": ..., "sep": ...} по началу файла."""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    enc = _sniff_encoding(head)
+    text = head.decode(enc, errors="ignore")
+    return {"encoding": enc, "sep": _sniff_sep(text)}
+
+def read_csv_with_dialect(path: str, **kwargs) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Один проход pd.read_csv с определённым диалектом. Возвращает (df, dialect)."""
+    dialect = sniff_dialect(path)
+    opts = dict(dtype=str, low_memory=False)
+    opts.update(kwargs)
+    try:
+        df = pd.read_csv(path, sep=dialect["sep"], encoding=dialect["encoding"], **opts)
+    except UnicodeDecodeError:
+        # Начало файла было ASCII/UTF-8, а дальше встретился cp1251
+        dialect["encoding"] = "cp1251"
+        df = pd.read_csv(path, sep=dialect["sep"], encoding="cp1251", encoding_errors="replace", **opts)
+    logger.info("[DATA.CSV] file=%s encoding=%s sep=%r", path, dialect["encoding"], dialect["sep"])
+    return df.fillna(""), dialect
+
+def read_csv_chunks(path: str, chunksize: int, reduce: Callable[[Iterator[pd.DataFrame]], T],
+                    **kwargs) -> Tuple[T, Dict[str, str]]:
+    """
+    Потоковое чтение: reduce получает итератор кусков (уже с fillna("")) и сворачивает их в результат.
+    Если UTF-8 «сломался» в середине файла — весь проход повторяется в cp1251.
+    """
+    dialect = sniff_dialect(path)
+    opts = dict(dtype=str, low_memory=False, chunksize=chunksize)
+    opts.update(kwargs)
+    try:
+        with pd.read_csv(path, sep=dialect["sep"], encoding=dialect["encoding"], **opts) as reader:
+            result = reduce(chunk.fillna("") for chunk in reader)
+    except UnicodeDecodeError:
+        dialect["encoding"] = "cp1251"
+        with pd.read_csv(path, sep=dialect["sep"], encoding="cp1251", encoding_errors="replace", **opts) as reader:
+            result = reduce(chunk.fillna("") for chunk in reader)
+    logger.info("[DATA.CSV] file=%s encoding=%s sep=%r chunksize=%d", path, dialect["encoding"], dialect["sep"], chunksize)
+    return result, dialect
+
+def read_csv_smart(path: str, **kwargs) -> pd.DataFrame:
+    return read_csv_with_dialect(path, **kwargs)[0]
+
+def read_header(path: str) -> list:
+    """Только имена колонок (для схемы без полной загрузки файла)."""
+    dialect = sniff_dialect(path)
+    df = pd.read_csv(path, sep=dialect["sep"], encoding=dialect["encoding"], nrows=0,
+                     encoding_errors="replace")
+    return list(df.columns)
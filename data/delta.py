@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Дельта-выгрузки 1С: вместо полной перевыгрузки справочника рядом кладутся
+  <Имя>.delta.csv    — изменённые/новые строки (те же колонки, ключ GUID)
+  <Имя>.deleted.txt  — GUID удалённых элементов, по одному в строке
+Загрузчик сливает их по GUID с данными из кэша/снимка: изменённые строки заменяются на месте,
+новые дописываются в конец, удалённые выбрасываются.
+Применённая дельта переносится в DATA_CACHE_DIR/deltas/<Имя>/<метка>.* — по архиву
+результат восстанавливается, если кэш потерян; дельты старше полного CSV игнорируются.
+Проверка: python -m data.delta verify <Имя> <полная_выгрузка.csv>
+"""
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+import pandas as pd
+from config import DATA_DIR, DATA_CACHE_DIR
+
+logger = logging.getLogger("ragos")
+
+DELTA_SUFFIX = ".delta.csv"
+TOMBSTONE_SUFFIX = ".deleted.txt"
+KEY = "GUID"
+
+def is_delta_path(path: str) -> bool:
+    return path.endswith(DELTA_SUFFIX) or path.endswith(TOMBSTONE_SUFFIX)
+
+def entity_of(path: str) -> str:
+    base = os.path.basename(path)
+    for suffix in (DELTA_SUFFIX, TOMBSTONE_SUFFIX):
+        if base.endswith(suffix):
+            return base[:-len(suffix)]
+    return os.path.splitext(base)[0]
+
+def pending_paths(name: str) -> Tuple[Optional[str], Optional[str]]:
+    """(delta.csv, deleted.txt) в DATA_DIR — только существующие, иначе None."""
+    delta = os.path.join(DATA_DIR, name + DELTA_SUFFIX)
+    tomb = os.path.join(DATA_DIR, name + TOMBSTONE_SUFFIX)
+    return (delta if os.path.exists(delta) else None), (tomb if os.path.exists(tomb) else None)
+
+def has_pending(name: str) -> bool:
+    return any(pending_paths(name))
+
+def _archive_dir(name: str) -> str:
+    return os.path.join(DATA_CACHE_DIR, "deltas", name)
+
+def _archived_paths(name: str, stamp: int) -> Tuple[str, str]:
+    base = os.path.join(_archive_dir(name), str(stamp))
+    return base + DELTA_SUFFIX, base + TOMBSTONE_SUFFIX
+
+def archived(name: str, base_path: str) -> List[int]:
+    """
+    Метки архивных дельт, применимых к текущему полному CSV (новее его mtime), по порядку.
+    Дельты старше полной выгрузки уже в ней учтены — удаляем.
+    """
+    folder = _archive_dir(name)
+    try:
+        files = os.listdir(folder)
+        base_mtime = os.stat(base_path).st_mtime_ns
+    except OSError:
+        return []
+    stamps = sorted({int(f.split(".", 1)[0]) for f in files if f.split(".", 1)[0].isdigit()})
+    keep = []
+    for stamp in stamps:
+        if stamp > base_mtime:
+            keep.append(stamp)
+            continue
+        for p in _archived_paths(name, stamp):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+    return keep
+
+def read_tombstones(path: Optional[str]) -> Set[str]:
+    if not path:
+        return set()
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def read_delta(delta_path: Optional[str], tomb_path: Optional[str],
+               columns: Optional[List[str]] = None) -> Tuple[Optional[pd.DataFrame], Set[str]]:
+    """(upserts, удалённые GUID). columns — колонки проекции, как у основного файла."""
+    upserts = None
+    if delta_path:
+        from data.csv_io import read_csv_with_dialect
+        kwargs = {"usecols": set(columns).__contains__} if columns else {}
+        upserts, _ = read_csv_with_dialect(delta_path, **kwargs)
+    return upserts, read_tombstones(tomb_path)
+
+def apply_delta(base: pd.DataFrame, upserts: Optional[pd.DataFrame], deleted: Set[str]) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Слияние по GUID. Порядок строк как у полной выгрузки с теми же изменениями:
+    оставшиеся на своих местах, новые — в конце. Типы колонок (Categorical/string) сохраняются.
+    """
+    if KEY not in base.columns:
+        raise ValueError(f"в данных нет колонки {KEY}")
+    stats = {"updated": 0, "inserted": 0, "deleted": 0}
+    keys = base[KEY].astype(str)
+    drop = keys.isin(deleted) if deleted else pd.Series(False, index=base.index)
+    if upserts is not None and len(upserts):
+        if KEY not in upserts.columns or set(upserts.columns) != set(base.columns):
+            raise ValueError(f"колонки дельты не совпадают с основным файлом: {list(upserts.columns)}")
+        up = upserts.drop_duplicates(KEY, keep="last").set_index(KEY, drop=False)
+        up = up[~up.index.isin(deleted)] if deleted else up
+    else:
+        up = None
+    stats["deleted"] = int(drop.sum())
+    out = base.loc[~drop].copy()
+    keys = keys.loc[~drop]
+    if up is not None and len(up):
+        hit = keys.isin(up.index)
+        src = up.loc[keys[hit]]
+        fresh = up.loc[~up.index.isin(keys)]
+        for col in out.columns:
+            values = pd.concat([src[col], fresh[col]])
+            if isinstance(out[col].dtype, pd.CategoricalDtype):
+                extra = pd.Index(values.unique()).difference(out[col].cat.categories)
+                if len(extra):
+                    out[col] = out[col].cat.add_categories(extra)
+            if hit.any():
+                out.loc[hit.to_numpy(), col] = src[col].to_numpy()
+        if len(fresh):
+            fresh = fresh[out.columns].reset_index(drop=True).astype(out.dtypes.to_dict())
+            out = pd.concat([out, fresh], ignore_index=True)
+        stats["updated"] = int(hit.sum())
+        stats["inserted"] = len(fresh)
+    return out.reset_index(drop=True), stats
+
+def _archive(name: str, delta_path: Optional[str], tomb_path: Optional[str]) -> int:
+    stamp = time.time_ns()
+    os.makedirs(_archive_dir(name), exist_ok=True)
+    for src, dst in zip((delta_path, tomb_path), _archived_paths(name, stamp)):
+        if src:
+            os.replace(src, dst)
+    return stamp
+
+def merge(name: str, df: pd.DataFrame, stamps: List[int], applied: List[int],
+          columns: Optional[List[str]] = None) -> Tuple[pd.DataFrame, List[int], Dict]:
+    """
+    Доводит df до актуального состояния: применяет архивные дельты из stamps, которых нет в applied,
+    затем ожидающие в DATA_DIR (и переносит их в архив).
+    Возвращает (df, список применённых меток, суммарная статистика).
+    """
+    total = {"updated": 0, "inserted": 0, "deleted": 0, "files": 0}
+    applied = list(applied)
+    for stamp in stamps:
+        if stamp in applied:
+            continue
+        d, t = _archived_paths(name, stamp)
+        df, st = apply_delta(df, *read_delta(d if os.path.exists(d) else None,
+                                             t if os.path.exists(t) else None, columns))
+        applied.append(stamp)
+        for k in st:
+            total[k] += st[k]
+        total["files"] += 1
+    delta_path, tomb_path = pending_paths(name)
+    if delta_path or tomb_path:
+        df, st = apply_delta(df, *read_delta(delta_path, tomb_path, columns))
+        for k in st:
+            total[k] += st[k]
+        total["files"] += 1
+        try:
+            applied.append(_archive(name, delta_path, tomb_path))
+        except OSError as e:
+            # Другой процесс уже забрал дельту в архив — результат тот же, метку возьмём при следующей загрузке
+            logger.warning("[DATA.DELTA.ARCHIVE] entity=%s err=%s", name, e)
+    if total["files"]:
+        logger.info("[DATA.DELTA] entity=%s files=%d updated=%d inserted=%d deleted=%d rows=%d",
+                    name, total["files"], total["updated"], total["inserted"], total["deleted"], len(df))
+    return df, applied, total
+
+def _canonical(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.astype(object).fillna("").astype(str)
+    return out.sort_values(KEY, kind="stable").reset_index(drop=True)[sorted(out.columns)]
+
+def compare_frames(merged: pd.DataFrame, full: pd.DataFrame) -> Dict:
+    """Сверка результата слияния с полной загрузкой (без учёта порядка строк и типов колонок)."""
+    report = {"equal": False, "rows": (len(merged), len(full)), "missing": 0, "extra": 0,
+              "diff_cells": 0, "columns": sorted(set(merged.columns) ^ set(full.columns))}
+    if report["columns"]:
+        return report
+    a, b = _canonical(merged), _canonical(full)
+    ka, kb = set(a[KEY]), set(b[KEY])
+    report["missing"] = len(kb - ka)
+    report["extra"] = len(ka - kb)
+    if not report["missing"] and not report["extra"] and len(a) == len(b):
+        report["diff_cells"] = int((a.to_numpy() != b.to_numpy()).sum())
+    report["equal"] = (not report["missing"] and not report["extra"] and len(a) == len(b)
+                       and not report["diff_cells"])
+    return report
+
+def verify(name: str, full_path: str) -> Dict:
+    """Загружает сущность с дельтами и сверяет с полной выгрузкой full_path."""
+    from data.loader import load_entity, projection_for
+    from data.csv_io import read_csv_with_dialect
+    _, merged, _ = load_entity(os.path.join(DATA_DIR, name + ".csv"))
+    cols = projection_for(name)
+    full, _ = read_csv_with_dialect(full_path, **({"usecols": set(cols).__contains__} if cols else {}))
+    report = compare_frames(merged, full)
+    logger.info("[DATA.DELTA.VERIFY] entity=%s %s", name, report)
+    return report
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Дельта-выгрузки ExportedData")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_verify = sub.add_parser("verify", help="сверить слияние дельт с полной выгрузкой")
+    p_verify.add_argument("entity")
+    p_verify.add_argument("full_csv")
+    args = parser.parse_args()
+    report = verify(args.entity, args.full_csv)
+    print(("✅ Совпадает с полной выгрузкой: " if report["equal"] else "❌ Расхождение: ") + str(report))
+    raise SystemExit(0 if report["equal"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Компактное представление GUID: 128 бит = две колонки uint64 (hi, lo) или одно int (ключ графа).
+Преобразования векторные: строка → hex → bytes.fromhex одним вызовом → np.frombuffer,
+обратно — через hex всего буфера и вставку дефисов в матрице байтов.
+Невалидный/пустой GUID кодируется нулём и декодируется в "".
+"""
+from typing import List
+import numpy as np
+import pandas as pd
+
+_ZERO_HEX = "0" * 32
+# позиции дефисов канонической формы 8-4-4-4-12
+_SPANS = ((0, 8, 0), (8, 12, 9), (12, 16, 14), (16, 20, 19), (20, 32, 24))
+
+def _hex32(values, strict: bool) -> np.ndarray:
+    s = pd.Series(values, copy=False).fillna("").astype(str)
+    s = s.str.strip().str.strip("{}").str.replace("-", "", regex=False).str.lower()
+    # Быстрый путь — проверка длины; полная проверка hex регуляркой только если fromhex не справился
+    ok = s.str.fullmatch(r"[0-9a-f]{32}") if strict else (s.str.len() == 32)
+    return s.where(ok.fillna(False).astype(bool), _ZERO_HEX).to_numpy(dtype="S32")
+
+def encode(values) -> np.ndarray:
+    """Строки GUID → массив (n, 2) uint64 [hi, lo]."""
+    hexes = _hex32(values, strict=False)
+    if not len(hexes):
+        return np.zeros((0, 2), dtype=np.uint64)
+    try:
+        raw = bytes.fromhex(hexes.tobytes().decode("ascii"))
+    except (ValueError, UnicodeDecodeError):
+        raw = bytes.fromhex(_hex32(values, strict=True).tobytes().decode("ascii"))
+    return np.frombuffer(raw, dtype=">u8").reshape(-1, 2).astype(np.uint64)
+
+def decode(pairs: np.ndarray) -> np.ndarray:
+    """(n, 2) uint64 → массив канонических строк GUID (object), нули → ""."""
+    pairs = np.asarray(pairs, dtype=np.uint64).reshape(-1, 2)
+    n = len(pairs)
+    if not n:
+        return np.array([], dtype=object)
+    hexes = np.frombuffer(pairs.astype(">u8").tobytes().hex().encode("ascii"), dtype=np.uint8).reshape(n, 32)
+    out = np.full((n, 36), ord("-"), dtype=np.uint8)
+    for src_a, src_b, dst in _SPANS:
+        out[:, dst:dst + (src_b - src_a)] = hexes[:, src_a:src_b]
+    strs = out.view("S36").ravel().astype(str).astype(object)
+    strs[(pairs[:, 0] == 0) & (pairs[:, 1] == 0)] = ""
+    return strs
+
+def to_keys(values) -> List[int]:
+    """Строки GUID → 128-битные int (0 — пустой/невалидный). Для ключей графа и словарей."""
+    raw = encode(values).astype(">u8").tobytes()
+    return [int.from_bytes(raw[i:i + 16], "big") for i in range(0, len(raw), 16)]
+
+def to_key(value) -> int:
+    return to_keys([value])[0]
+
+def to_str(key) -> str:
+    """Ключ → каноническая строка. Строки (графы старого формата) возвращаются как есть."""
+    if isinstance(key, str):
+        return key
+    if not key:
+        return ""
+    h = f"{int(key):032x}"
+    return f"{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
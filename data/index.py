@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Инвертированный индекс значений колонки: значение (строковое представление, как в
+df[col].fillna("").astype(str)) → отсортированный массив позиций строк (int32).
+Строится лениво при первом обращении к (сущность, колонка) и живёт до смены версии данных
+(data.version) или замены DataFrame. Дальше:
+  количество строк со значением — длина среза, список — take по позициям,
+  «есть ли точное значение» — проверка ключа в словаре.
+Для Categorical индекс строится по кодам без построчного приведения к строкам.
+"""
+import logging
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import VALUE_INDEX, VALUE_INDEX_MAX
+from data import version
+
+logger = logging.getLogger("ragos")
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+class ValueIndex:
+    def __init__(self, s: pd.Series):
+        codes, uniques = factorize(s)
+        self.rows = len(s)
+        self.uniques = uniques                              # np.ndarray[str] — различные значения
+        self.key_of: Dict[str, int] = {v: i for i, v in enumerate(uniques)}
+        counts = np.bincount(codes, minlength=len(uniques)) if len(codes) else np.zeros(len(uniques), np.int64)
+        self.counts = counts.astype(np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        # stable: внутри значения позиции остаются по возрастанию
+        self.order = np.argsort(codes, kind="stable").astype(np.int32)
+
+    def __contains__(self, value) -> bool:
+        return str(value) in self.key_of
+
+    def __len__(self) -> int:
+        return len(self.uniques)
+
+    def positions(self, value) -> np.ndarray:
+        k = self.key_of.get(str(value))
+        if k is None:
+            return _EMPTY
+        return self.order[self.starts[k]:self.starts[k + 1]]
+
+    def count(self, value) -> int:
+        k = self.key_of.get(str(value))
+        return 0 if k is None else int(self.counts[k])
+
+    def codes(self) -> np.ndarray:
+        """Код значения (номер в uniques) для каждой строки — восстанавливается из order/counts без factorize."""
+        codes = np.empty(self.rows, dtype=np.int32)
+        codes[self.order] = np.repeat(np.arange(len(self.uniques), dtype=np.int32), self.counts)
+        return codes
+
+    def nbytes(self) -> int:
+        return int(self.order.nbytes + self.counts.nbytes + self.starts.nbytes + self.uniques.nbytes)
+
+def factorize(s: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """(коды строк, различные строковые значения); NaN → "" — как у fillna("").astype(str)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy().astype(np.int64)
+        missing = codes < 0
+        cats = s.cat.categories.astype(str).tolist() + ([""] if missing.any() else [])
+        # разные категории могут дать одну строку (1 и "1", "" и NaN) — склеиваем
+        cat_codes, uniques = pd.factorize(np.array(cats, dtype=object))
+        codes[missing] = len(cats) - 1
+        return cat_codes[codes], uniques.astype(object)
+    codes, uniques = pd.factorize(s.fillna("").astype(str).to_numpy(dtype=object))
+    return codes, np.asarray(uniques, dtype=object)
+
+# (сущность, колонка) → индекс; LRU по VALUE_INDEX_MAX (общая логика — version.EntityCache)
+_INDEXES = version.EntityCache(VALUE_INDEX_MAX)
+STATS = _INDEXES.stats
+
+def get_index(entity: str, column: str, df: pd.DataFrame) -> Optional[ValueIndex]:
+    """Индекс колонки df (сущность entity); None — индексы выключены (VALUE_INDEX)."""
+    if not VALUE_INDEX:
+        return None
+    idx, ms = _INDEXES.get(entity, column, df, lambda: ValueIndex(df[column]))
+    if ms is not None:
+        logger.info("[DATA.INDEX.BUILD] entity=%s column=%s values=%d rows=%d ms=%.1f",
+                    entity, column, len(idx), idx.rows, ms)
+    return idx
+
+def has_value(entity: str, df: pd.DataFrame, column: str, value) -> bool:
+    """Есть ли в колонке точное значение (как str): O(1) по индексу, при выключенном — по подготовленной колонке."""
+    idx = get_index(entity, column, df)
+    if idx is not None:
+        return value in idx
+    from data.columns import prepared_column
+    return value in prepared_column(entity, column, df)
+
+def index_stats() -> dict:
+    indexes = _INDEXES.values()
+    return dict(STATS, size=len(indexes), mb=round(sum(i.nbytes() for i in indexes) / 1048576, 1))
+
+def clear_indexes():
+    _INDEXES.clear()
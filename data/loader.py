@@ -1,20 +1,306 @@
 # -*- coding: utf-8 -*-
-import os, glob
+"""
+Загрузка ExportedData/*.csv в DataFrame.
+Рядом с выгрузкой (DATA_CACHE_DIR) держим колоночный кэш каждого CSV:
+  <Имя>.feather (или .pkl без pyarrow) + <Имя>.meta.json
+Кэш валиден, пока совпадают размер и mtime CSV; если mtime изменился,
+а размер нет — сверяем хэш содержимого (1С часто перезаписывает файлы без изменений).
+Файлы разбираются параллельно (пул процессов, при сбое — пул потоков).
+В компактном режиме (LOAD_COMPACT) повторяющиеся колонки хранятся как Categorical (см. data/compact.py);
+GUID-колонки — string[pyarrow] в любом режиме (GUID_COMPACT).
+Если есть актуальный общий снимок (USE_SNAPSHOT, data/snapshot.py), сущности берутся из него
+через memory_map — без разбора и без собственной копии в памяти процесса.
+Режим проекции (LOAD_PROJECTION) читает только колонки из описание.txt + GUID/Наименование;
+файлы больше LOAD_CHUNK_MB читаются частями с поколонным сжатием (data.compact.compact_chunks).
+"""
+import os, glob, json, time, hashlib, logging
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple, List
 import pandas as pd
-from config import DATA_DIR
-
-def _read_csv_smart(path: str):
-    for enc in ("utf-8-sig", "utf-8", "cp1251"):
-        for sep in (";", ","):
-            try:
-                return pd.read_csv(path, sep=sep, dtype=str, encoding=enc, low_memory=False).fillna("")
-            except Exception:
-                continue
-    return pd.read_csv(path, sep=";", dtype=str, encoding="utf-8", errors="replace", low_memory=False).fillna("")
-
-def load_dataframes():
+from config import (DATA_DIR, DATA_CACHE_DIR, ENABLE_DATA_CACHE, LOAD_POOL, LOAD_WORKERS, LOAD_COMPACT,
+                    USE_SNAPSHOT, LOAD_PROJECTION, LOAD_PROJECTION_EXTRA, LOAD_CHUNK_MB, LOAD_CHUNK_ROWS)
+from data.csv_io import read_csv_with_dialect, read_csv_chunks
+from data.compact import compact_frame, compact_chunks, compact_guids, memory_bytes
+from data import delta as _delta
+from core.schema import get_projection
+from data import snapshot as _snapshot
+
+logger = logging.getLogger("ragos")
+
+# Версия формата кэша: поднимать при изменении логики чтения CSV
+_CACHE_VERSION = 4
+
+_CACHE_EXT = ".feather" if importlib.util.find_spec("pyarrow") else ".pkl"
+
+# Статистика последней загрузки (для отчётов ingest/GUI)
+LAST_LOAD_STATS: dict = {"hits": 0, "misses": 0, "seconds": 0.0, "entities": {}}
+
+# --- Кэш ---
+
+def _file_hash(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _cache_paths(name: str) -> Tuple[str, str]:
+    base = os.path.join(DATA_CACHE_DIR, name)
+    return base + _CACHE_EXT, base + ".meta.json"
+
+def _write_json_atomic(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _read_frame(path: str) -> pd.DataFrame:
+    if path.endswith(".feather"):
+        # string-колонки (GUID) возвращаются как string[pyarrow], а не string[python]
+        with pd.option_context("mode.string_storage", "pyarrow"):
+            return pd.read_feather(path)
+    return pd.read_pickle(path)
+
+def _write_frame(df: pd.DataFrame, path: str):
+    tmp = path + ".tmp"
+    if path.endswith(".feather"):
+        df.reset_index(drop=True).to_feather(tmp)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+def projection_for(name: str, enabled: bool = LOAD_PROJECTION) -> Optional[List[str]]:
+    """Колонки для чтения сущности в режиме проекции; None — читать все."""
+    if not enabled:
+        return None
+    return get_projection(name, LOAD_PROJECTION_EXTRA.get(name))
+
+def _read_cache(csv_path: str, name: str, compact: bool, projection: Optional[List[str]] = None,
+                deltas: Optional[List[int]] = None) -> Tuple[Optional[pd.DataFrame], dict]:
+    data_path, meta_path = _cache_paths(name)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None, {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return None, {}
+    st = os.stat(csv_path)
+    if meta.get("version") != _CACHE_VERSION or meta.get("size") != st.st_size:
+        return None, {}
+    if bool(meta.get("compact")) != compact or meta.get("projection") != projection:
+        return None, {}
+    if meta.get("deltas", []) != (deltas or []):
+        return None, {}
+    if meta.get("mtime_ns") != st.st_mtime_ns:
+        # Файл перезаписан — проверяем, изменилось ли содержимое
+        if meta.get("hash") != _file_hash(csv_path):
+            return None, {}
+        meta["mtime_ns"] = st.st_mtime_ns
+        try:
+            _write_json_atomic(meta_path, meta)
+        except Exception:
+            pass
+    try:
+        return _read_frame(data_path), meta
+    except Exception as e:
+        logger.warning("[DATA.CACHE.BROKEN] entity=%s err=%s", name, e)
+        return None, {}
+
+def _write_cache(csv_path: str, name: str, df: pd.DataFrame, dialect: dict, compact: Optional[dict],
+                 projection: Optional[List[str]] = None, deltas: Optional[List[int]] = None):
+    data_path, meta_path = _cache_paths(name)
+    try:
+        os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+        st = os.stat(csv_path)
+        _write_frame(df, data_path)
+        _write_json_atomic(meta_path, {
+            "version": _CACHE_VERSION,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": _file_hash(csv_path),
+            "rows": len(df),
+            "encoding": dialect.get("encoding"),
+            "sep": dialect.get("sep"),
+            "compact": compact is not None,
+            "projection": projection,
+            "deltas": deltas or [],
+            "mem_before": (compact or {}).get("before"),
+            "mem_after": (compact or {}).get("after"),
+        })
+    except Exception as e:
+        logger.warning("[DATA.CACHE.WRITE_FAIL] entity=%s err=%s", name, e)
+
+# --- Загрузка ---
+
+def load_entity(path: str, use_cache: bool = ENABLE_DATA_CACHE, compact: bool = LOAD_COMPACT,
+                snapshot: bool = USE_SNAPSHOT, projection: bool = LOAD_PROJECTION) -> Tuple[str, pd.DataFrame, dict]:
+    """
+    Читает один CSV (из общего снимка или кэша, если они валидны) и доливает дельты (data/delta.py).
+    Возвращает (имя, df, info), info = {"source": "snapshot"|"cache"|"delta"|"csv", "encoding", "sep",
+    "mem_before", "mem_after", "projection", "deltas"}.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    cols = projection_for(name, projection)
+    # Снимок/кэш хранят данные уже с архивными дельтами — валидны, только если набор меток тот же
+    stamps = _delta.archived(name, path)
+    df, info, report = None, None, None
+    if snapshot:
+        got = _snapshot.open_entity(name, path, compact, cols, stamps)
+        if got is not None:
+            df, info = got
+    if df is None and use_cache:
+        df, meta = _read_cache(path, name, compact, cols, stamps)
+        if df is not None:
+            info = {"source": "cache", "encoding": meta.get("encoding"), "sep": meta.get("sep"),
+                    "mem_before": meta.get("mem_before"), "mem_after": meta.get("mem_after")}
+    applied = stamps
+    if df is None:
+        # usecols функцией: колонки из описания, которых нет в файле, просто пропускаются
+        kwargs = {"usecols": set(cols).__contains__} if cols else {}
+        if LOAD_CHUNK_MB and os.path.getsize(path) > LOAD_CHUNK_MB * 1024 * 1024:
+            (df, report), dialect = read_csv_chunks(
+                path, LOAD_CHUNK_ROWS, lambda chunks: compact_chunks(name, chunks, compact), **kwargs)
+            if not compact:
+                report = None
+        else:
+            df, dialect = read_csv_with_dialect(path, **kwargs)
+            if compact:
+                df, report = compact_frame(name, df)
+        if not compact:
+            # GUID → string[pyarrow] и без компактного режима (GUID_COMPACT)
+            df, _ = compact_guids(name, df)
+        info = dict(dialect, source="csv",
+                    mem_before=(report or {}).get("before"), mem_after=(report or {}).get("after"))
+        applied = []
+    merged = False
+    if applied != stamps or _delta.has_pending(name):
+        try:
+            df, applied, dstats = _delta.merge(name, df, stamps, applied, cols)
+        except ValueError as e:
+            logger.warning("[DATA.DELTA.SKIP] entity=%s err=%s → нужна полная выгрузка", name, e)
+        else:
+            merged = dstats["files"] > 0
+            if merged:
+                info["delta"] = dstats
+                if info["source"] != "csv":
+                    info["source"] = "delta"
+                if compact:
+                    info["mem_after"] = memory_bytes(df)
+    info.update(projection=cols, deltas=applied)
+    if use_cache and (info["source"] == "csv" or merged):
+        report = {"before": info.get("mem_before"), "after": info.get("mem_after")} if compact else None
+        _write_cache(path, name, df, info, report, cols, applied)
+    return name, df, info
+
+def _load_task(path: str, use_cache: bool, compact: bool):
+    # Выполняется в воркере пула — только picklable-аргументы и результат.
+    # Снимок здесь не открываем: отображение в воркере всё равно скопировалось бы при передаче
+    t0 = time.perf_counter()
+    name, df, info = load_entity(path, use_cache=use_cache, compact=compact, snapshot=False)
+    info["seconds"] = time.perf_counter() - t0
+    return name, df, info
+
+def _run_pool(executor_cls, paths: List[str], workers: int, use_cache: bool, compact: bool, out: dict):
+    with executor_cls(max_workers=workers) as ex:
+        futs = [ex.submit(_load_task, p, use_cache, compact) for p in paths]
+        for fut in as_completed(futs):
+            name, df, info = fut.result()
+            out[name] = (df, info)
+
+def _load_parallel(paths: List[str], use_cache: bool, compact: bool, pool: str, workers: int) -> dict:
+    """
+    Крупные файлы ставим в очередь первыми: каждый файл — отдельная задача,
+    поэтому один огромный CSV занимает один воркер, а мелкие разбираются рядом с ним.
+    """
+    paths = sorted(paths, key=lambda p: os.path.getsize(p), reverse=True)
+    out: dict = {}
+    # Во вложенном процессе (воркер spawn) пул процессов не поднимаем
+    if pool == "process" and multiprocessing.parent_process() is None:
+        try:
+            _run_pool(ProcessPoolExecutor, paths, workers, use_cache, compact, out)
+            return out
+        except Exception as e:
+            logger.warning("[DATA.LOAD.POOL] process pool failed: %s → fallback to threads", e)
+    rest = [p for p in paths if os.path.splitext(os.path.basename(p))[0] not in out]
+    _run_pool(ThreadPoolExecutor, rest, workers, use_cache, compact, out)
+    return out
+
+def entity_paths() -> List[str]:
+    """CSV сущностей в DATA_DIR (без дельта-файлов <Имя>.delta.csv)."""
+    return [p for p in glob.glob(os.path.join(DATA_DIR, "*.csv")) if not _delta.is_delta_path(p)]
+
+def load_dataframes(use_cache: bool = ENABLE_DATA_CACHE, pool: Optional[str] = None, workers: Optional[int] = None,
+                    compact: bool = LOAD_COMPACT, lazy: bool = False, snapshot: bool = USE_SNAPSHOT):
+    """
+    {Имя: DataFrame} по всем CSV из DATA_DIR.
+    pool: "process" | "thread" | "off" (по умолчанию LOAD_POOL), workers: 0 = по числу ядер,
+    compact: малокардинальные колонки → Categorical,
+    lazy: вернуть ленивый реестр (data.registry.LazyFrames) — сущности читаются при первом обращении,
+    snapshot: брать актуальные сущности из общего снимка (mmap), а прочитанные заново — дописать в него.
+    """
+    paths = entity_paths()
+    if lazy:
+        from data.registry import LazyFrames
+        return LazyFrames(paths, use_cache=use_cache, compact=compact, snapshot=snapshot)
+    pool = (pool or LOAD_POOL or "off").lower()
+    workers = workers if workers is not None else LOAD_WORKERS
+
+    t_all = time.perf_counter()
+    loaded = _snapshot.open_snapshot(paths, compact, LOAD_PROJECTION) if snapshot else {}
+    rest = [p for p in paths if os.path.splitext(os.path.basename(p))[0] not in loaded]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(rest)))
+    if pool in ("process", "thread") and workers > 1:
+        loaded.update(_load_parallel(rest, use_cache, compact, pool, workers))
+    else:
+        for p in rest:
+            name, df, info = _load_task(p, use_cache, compact)
+            loaded[name] = (df, info)
+
     dfs = {}
-    for path in glob.glob(os.path.join(DATA_DIR, "*.csv")):
-        name = os.path.splitext(os.path.basename(path))[0]
-        dfs[name] = _read_csv_smart(path)
-    return dfs
\ No newline at end of file
+    stats = {"hits": 0, "misses": 0, "seconds": 0.0, "entities": {}, "pool": pool, "workers": workers}
+    for p in paths:  # порядок как у glob — как и раньше
+        name = os.path.splitext(os.path.basename(p))[0]
+        df, info = loaded[name]
+        dfs[name] = df
+        stats["hits" if info["source"] in ("cache", "snapshot", "delta") else "misses"] += 1
+        stats["entities"][name] = dict(info, rows=len(df))
+    if snapshot and rest:
+        # Следующие процессы откроют эти сущности из снимка вместо разбора/чтения кэша
+        fresh = {}
+        for p in rest:
+            name = os.path.splitext(os.path.basename(p))[0]
+            fresh[name] = (p,) + loaded[name]
+        for name, (df, _) in _snapshot.publish(fresh, compact).items():
+            dfs[name] = df
+    stats["seconds"] = time.perf_counter() - t_all
+    LAST_LOAD_STATS.clear()
+    LAST_LOAD_STATS.update(stats)
+    logger.info("[DATA.LOAD] %s", format_load_stats(stats))
+    if compact:
+        logger.info("[DATA.MEM] %s", format_memory_report(stats))
+    return dfs
+
+def format_load_stats(stats: Optional[dict] = None) -> str:
+    """Однострочный отчёт: попадания/промахи кэша и время загрузки по сущностям."""
+    s = stats or LAST_LOAD_STATS
+    per = ", ".join(
+        f"{name}={e['source']}:{e['rows']}rows/{e['seconds'] * 1000:.0f}ms[{e.get('encoding')},{e.get('sep')!r}]"
+        + (f"(Δ~{e['delta']['updated']}+{e['delta']['inserted']}-{e['delta']['deleted']})" if e.get("delta") else "")
+        for name, e in s.get("entities", {}).items()
+    )
+    return (f"cache hits={s.get('hits', 0)} misses={s.get('misses', 0)} total={s.get('seconds', 0.0):.2f}s "
+            f"pool={s.get('pool', 'off')}x{s.get('workers', 1)} | {per}")
+
+
+def format_memory_report(stats: Optional[dict] = None) -> str:
+    """Память по сущностям до/после компактного режима (по данным последней загрузки или мета кэша)."""
+    s = stats or LAST_LOAD_STATS
+    parts = []
+    for name, e in s.get("entities", {}).items():
+        before, after = e.get("mem_before"), e.get("mem_after")
+        if before:
+            parts.append(f"{name}: {before / 1048576:.1f}MB → {after / 1048576:.1f}MB")
+    return ", ".join(parts) or "—"
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Триграммный инвертированный индекс по списку строк (различные значения колонки, имена узлов графа).
+Перед точным WRatio отбирает кандидатов: значения, у которых больше всего общих триграмм
+с запросом. Строки дополняются пробелом с краёв, так что начало и конец слова — тоже триграммы.
+Индекс хранится в виде CSR: для триграммы — срез массива номеров строк; строится векторно
+(все строки — один массив кодовых точек), без цикла по триграммам в Python.
+"""
+import time
+import logging
+from typing import List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from config import FUZZY_NGRAM_CANDIDATES
+
+logger = logging.getLogger("ragos")
+
+def _grams(padded: List[str]):
+    """(коды триграмм int64, номер строки) для строк, уже дополненных пробелами.
+    Код триграммы — три кодовые точки по 21 бит; строки склеиваются в один массив UTF-32."""
+    lens = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    cp = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if len(cp) < 3:
+        return np.zeros(0, np.int64), np.zeros(0, np.int32)
+    codes = (cp[:-2] << 42) | (cp[1:-1] << 21) | cp[2:]
+    owner = np.repeat(np.arange(len(padded), dtype=np.int32), lens)[:-2]
+    # триграмма не должна захватывать начало следующей строки
+    inside = np.arange(len(codes)) + 2 < np.cumsum(lens)[owner]
+    return codes[inside], owner[inside]
+
+class TrigramIndex:
+    def __init__(self, choices: Sequence[str]):
+        t0 = time.perf_counter()
+        self.size = len(choices)
+        codes, owner = _grams([f" {c} " for c in choices])
+        gid, uniques = pd.factorize(codes)
+        # stable: внутри триграммы номера строк остаются по возрастанию; повторы в одной строке — убираем
+        order = np.argsort(gid, kind="stable")
+        gid, owner = gid[order], owner[order]
+        keep = np.ones(len(gid), dtype=bool)
+        keep[1:] = (gid[1:] != gid[:-1]) | (owner[1:] != owner[:-1])
+        gid = gid[keep]
+        self.grams = pd.Index(uniques)                                     # код триграммы → номер
+        self.postings = owner[keep]                                        # номера строк по триграммам
+        self.starts = np.concatenate(([0], np.cumsum(np.bincount(gid, minlength=len(uniques))))).astype(np.int64)
+        logger.info("[DATA.NGRAM.BUILD] choices=%d grams=%d postings=%d ms=%.1f", self.size, len(uniques),
+                    len(self.postings), (time.perf_counter() - t0) * 1000)
+
+    def candidates(self, query: str, limit: int = FUZZY_NGRAM_CANDIDATES,
+                   allowed: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Номера строк (по возрастанию) — до limit с наибольшим числом общих триграмм с query
+        (query — в том же регистре, что и индекс, обычно casefold).
+        allowed — булева маска допустимых строк (например, узлы нужного типа).
+        None — префильтр бессилен (нет ни одной известной триграммы): нужен полный перебор.
+        """
+        codes, _ = _grams([f" {query} "])
+        ids = self.grams.get_indexer(np.unique(codes))
+        ids = ids[ids >= 0]
+        if not len(ids):
+            return None
+        hits = np.concatenate([self.postings[self.starts[k]:self.starts[k + 1]] for k in ids])
+        shared = np.bincount(hits, minlength=self.size)
+        if allowed is not None:
+            shared[~allowed] = 0
+        found = np.flatnonzero(shared)
+        if len(found) > limit:
+            # порог — limit-е по величине число общих триграмм; на пороге — первые по порядку строк
+            s = shared[found]
+            kth = np.partition(s, len(found) - limit)[len(found) - limit]
+            top = found[s > kth]
+            found = np.sort(np.concatenate((top, found[s == kth][:limit - len(top)])))
+        return found
+
+    def nbytes(self) -> int:
+        return int(self.postings.nbytes + self.starts.nbytes + self.grams.nbytes)
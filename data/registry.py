@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Ленивый реестр DataFrame: {Имя: DataFrame}, но сущность читается (через кэш load_entity)
+только при первом обращении. Ключи — по списку CSV, колонки — по заголовкам файлов,
+так что `entity in dfs` и схема для промптов не требуют полной загрузки.
+При заданном бюджете памяти редко используемые сущности вытесняются (LRU)
+и при следующем обращении перечитываются из колоночного кэша.
+Если есть актуальный общий снимок (data/snapshot.py), сущность открывается из него через mmap.
+"""
+import os
+import threading
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, List, Optional
+import pandas as pd
+from config import ENABLE_DATA_CACHE, LOAD_COMPACT, LAZY_MEMORY_BUDGET_MB, USE_SNAPSHOT
+from data.csv_io import read_header
+from data.compact import memory_bytes
+from data.snapshot import publish
+
+logger = logging.getLogger("ragos")
+
+class LazyFrames(Mapping):
+    def __init__(self, paths: Optional[List[str]] = None, budget_mb: int = LAZY_MEMORY_BUDGET_MB,
+                 use_cache: bool = ENABLE_DATA_CACHE, compact: bool = LOAD_COMPACT,
+                 snapshot: bool = USE_SNAPSHOT):
+        if paths is None:
+            from data.loader import entity_paths
+            paths = entity_paths()
+        self._paths: Dict[str, str] = {os.path.splitext(os.path.basename(p))[0]: p for p in paths}
+        self._frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._headers: Dict[str, List[str]] = {}
+        self._budget = int(budget_mb or 0) * 1024 * 1024
+        self._use_cache = use_cache
+        self._compact = compact
+        self._snapshot = snapshot
+        self._lock = threading.RLock()
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    # --- Mapping ---
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        with self._lock:
+            df = self._frames.get(name)
+            if df is not None:
+                self._frames.move_to_end(name)
+                self.stats["hits"] += 1
+                return df
+            if name not in self._paths:
+                raise KeyError(name)
+            return self._load(name)
+
+    def __contains__(self, name) -> bool:
+        return name in self._paths
+
+    def __iter__(self):
+        return iter(list(self._paths))
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    # --- Служебное ---
+    def _load(self, name: str) -> pd.DataFrame:
+        from data.loader import load_entity
+        _, df, info = load_entity(self._paths[name], use_cache=self._use_cache, compact=self._compact,
+                                   snapshot=self._snapshot)
+        if self._snapshot and info.get("source") != "snapshot":
+            df, info = publish({name: (self._paths[name], df, info)}, self._compact)[name]
+        self._frames[name] = df
+        self._sizes[name] = info.get("mem_after") or memory_bytes(df)
+        self._headers[name] = list(df.columns)
+        self.stats["loads"] += 1
+        logger.info("[DATA.LAZY.LOAD] entity=%s source=%s rows=%d mem=%.1fMB",
+                    name, info.get("source"), len(df), self._sizes[name] / 1048576)
+        self._evict(keep=name)
+        return df
+
+    def _evict(self, keep: str):
+        if not self._budget:
+            return
+        while sum(self._sizes.get(n, 0) for n in self._frames) > self._budget and len(self._frames) > 1:
+            victim = next(n for n in self._frames if n != keep)
+            del self._frames[victim]
+            self._sizes.pop(victim, None)
+            self.stats["evictions"] += 1
+            logger.info("[DATA.LAZY.EVICT] entity=%s", victim)
+
+    def columns(self, name: str) -> List[str]:
+        """Колонки сущности без загрузки данных (по заголовку CSV)."""
+        with self._lock:
+            if name in self._frames:
+                return list(self._frames[name].columns)
+            if name not in self._headers:
+                if name not in self._paths:
+                    raise KeyError(name)
+                from data.loader import projection_for
+                header = read_header(self._paths[name])
+                cols = projection_for(name)
+                # В режиме проекции схема для промптов — только реально загружаемые колонки
+                self._headers[name] = [c for c in header if c in cols] if cols else header
+            return list(self._headers[name])
+
+    def replace(self, name: str, df: Optional[pd.DataFrame], path: Optional[str] = None):
+        """
+        Атомарная замена сущности (горячая перезагрузка): старый DataFrame не меняется,
+        запросы, уже взявшие его, дорабатывают на старых данных.
+        df=None — только сбросить загруженную копию (перечитается при обращении).
+        """
+        with self._lock:
+            if path:
+                self._paths[name] = path
+            self._headers.pop(name, None)
+            if df is None:
+                self._frames.pop(name, None)
+                self._sizes.pop(name, None)
+                return
+            self._frames[name] = df
+            self._sizes[name] = memory_bytes(df)
+            self._evict(keep=name)
+
+    def discard(self, name: str):
+        with self._lock:
+            self._paths.pop(name, None)
+            self._frames.pop(name, None)
+            self._sizes.pop(name, None)
+            self._headers.pop(name, None)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._frames
+
+    def loaded(self) -> List[str]:
+        return list(self._frames)
+
+def frame_columns(dfs: Mapping, name: str) -> List[str]:
+    """Колонки сущности: из заголовков для ленивого реестра, иначе из самого DataFrame."""
+    if isinstance(dfs, LazyFrames):
+        return dfs.columns(name)
+    return list(dfs[name].columns)
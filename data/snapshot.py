@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Общий снимок данных для всех процессов (GUI, CLI, ingest, скрипты menu.py).
+SNAPSHOT_DIR/
+  manifest.json          — версия снимка + по каждой сущности: файл, подпись CSV, compact
+  gen-<N>-<pid>/<Имя>.arrow  — Arrow IPC без сжатия
+Файлы открываются через pyarrow.memory_map только на чтение: страницы берутся из page cache ОС,
+поэтому несколько процессов держат одну физическую копию, а открытие почти бесплатное.
+Строковые колонки возвращаются как string[pyarrow] поверх отображённых буферов (без копирования),
+числовые колонки и коды Categorical — тоже прямо из отображения (split_blocks).
+Так воркеры пула (engine/sandbox.py) и другие процессы делят одни физические страницы.
+SNAPSHOT_STRINGS = "object" — строковые колонки снова object (своя копия в каждом процессе,
+как после CSV), кроме GUID-колонок (GUID_COMPACT).
+Запись манифеста ключуется по режиму compact (<Имя> / <Имя>@compact): процессы с разным
+LOAD_COMPACT не перетирают поколения друг друга.
+Чтение-изменение-запись manifest.json идёт под межпроцессной блокировкой (manifest.lock).
+Новое поколение пишет только изменившиеся сущности; неизменные продолжают ссылаться на старые файлы.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from config import SNAPSHOT_DIR, SNAPSHOT_STRINGS
+
+logger = logging.getLogger("ragos")
+
+try:
+    import pyarrow as pa
+    AVAILABLE = True
+except Exception:
+    pa = None
+    AVAILABLE = False
+
+# Версия формата снимка: поднимать при изменении раскладки файлов/манифеста
+_FORMAT = 2
+_MANIFEST = "manifest.json"
+_MANIFEST_LOCK = "manifest.lock"
+_MANIFEST_LOCK_TIMEOUT = 30.0
+
+_LOCK = threading.Lock()
+# Манифест кэшируется по mtime файла — load_entity дёргает его на каждую сущность
+_MANIFEST_CACHE: Tuple[Optional[int], dict] = (None, {})
+
+def _entry_key(name: str, compact: bool) -> str:
+    return f"{name}@compact" if compact else name
+
+def _manifest_path() -> str:
+    return os.path.join(SNAPSHOT_DIR, _MANIFEST)
+
+def _load_manifest(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("format") == _FORMAT else {}
+
+def read_manifest() -> dict:
+    global _MANIFEST_CACHE
+    path = _manifest_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    with _LOCK:
+        if _MANIFEST_CACHE[0] == mtime:
+            return _MANIFEST_CACHE[1]
+        try:
+            manifest = _load_manifest(path)
+        except Exception:
+            return {}
+        _MANIFEST_CACHE = (mtime, manifest)
+        return manifest
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def _manifest_locked():
+    """Межпроцессная блокировка манифеста: два процесса не перетрут записи друг друга."""
+    with open(os.path.join(SNAPSHOT_DIR, _MANIFEST_LOCK), "a+b") as f:
+        deadline = time.monotonic() + _MANIFEST_LOCK_TIMEOUT
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"манифест снимка занят дольше {_MANIFEST_LOCK_TIMEOUT:.0f} с")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+def snapshot_version() -> int:
+    """Версия данных снимка (растёт с каждым записанным поколением), 0 — снимка нет."""
+    return int(read_manifest().get("data_version", 0))
+
+def _is_fresh(entry: dict, csv_path: str, compact: bool, projection: Optional[List[str]],
+              deltas: Optional[List[int]]) -> bool:
+    if not entry or bool(entry.get("compact")) != compact or entry.get("projection") != projection:
+        return False
+    if entry.get("deltas", []) != (deltas or []):
+        return False
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return False
+    if entry.get("size") != st.st_size:
+        return False
+    if entry.get("mtime_ns") != st.st_mtime_ns:
+        # Перезаписан без изменений (частый случай выгрузки 1С) — сверяем хэш
+        from data.loader import _file_hash
+        return bool(entry.get("hash")) and entry["hash"] == _file_hash(csv_path)
+    return True
+
+def _string_mapper(t):
+    if t == pa.string() or t == pa.large_string():
+        return pd.StringDtype("pyarrow")
+    return None
+
+def _open_file(path: str) -> pd.DataFrame:
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    # Буферы таблицы ссылаются на отображение — оно живёт, пока жив DataFrame;
+    # split_blocks: колонки не склеиваются в общий 2D-блок (иначе — копия)
+    if SNAPSHOT_STRINGS != "object":
+        return table.to_pandas(types_mapper=_string_mapper, split_blocks=True)
+    # "object": строки — своя копия str-объектов; string[pyarrow] при записи (GUID) — поверх отображения
+    meta = table.schema.pandas_metadata or {}
+    arrow = [c["field_name"] for c in meta.get("columns", [])
+             if c.get("numpy_type") == "string" and c["field_name"] in table.column_names]
+    if not arrow:
+        return table.to_pandas(split_blocks=True)
+    rest = [c for c in table.column_names if c not in arrow]
+    df = table.select(rest).to_pandas(split_blocks=True)
+    for name in arrow:
+        df.insert(table.column_names.index(name), name,
+                  pd.Series(pd.arrays.ArrowStringArray(table.column(name)), index=df.index))
+    return df
+
+def open_entity(name: str, csv_path: str, compact: bool, projection: Optional[List[str]] = None,
+                deltas: Optional[List[int]] = None) -> Optional[Tuple[pd.DataFrame, dict]]:
+    """
+    (df, info) из снимка, если он есть и соответствует CSV, набору колонок проекции
+    и применённым дельтам; иначе None.
+    """
+    if not AVAILABLE:
+        return None
+    manifest = read_manifest()
+    entry = manifest.get("entities", {}).get(_entry_key(name, compact))
+    if not _is_fresh(entry, csv_path, compact, projection, deltas):
+        return None
+    try:
+        df = _open_file(os.path.join(SNAPSHOT_DIR, entry["file"]))
+    except Exception as e:
+        logger.warning("[DATA.SNAPSHOT.BROKEN] entity=%s err=%s", name, e)
+        return None
+    return df, {"source": "snapshot", "encoding": entry.get("encoding"), "sep": entry.get("sep"),
+                "mem_before": entry.get("mem_before"), "mem_after": entry.get("mem_after"),
+                "projection": projection, "deltas": deltas or [],
+                "snapshot_version": manifest.get("data_version")}
+
+def open_snapshot(paths: List[str], compact: bool, projection: bool = False) -> Dict[str, Tuple[pd.DataFrame, dict]]:
+    """Все сущности из paths, которые можно взять из снимка: {имя: (df, info)}."""
+    from data.loader import projection_for
+    from data import delta
+    out = {}
+    for p in paths:
+        name = os.path.splitext(os.path.basename(p))[0]
+        if delta.has_pending(name):
+            # Ждёт слияния с дельтой — пусть идёт через load_entity
+            continue
+        t0 = time.perf_counter()
+        got = open_entity(name, p, compact, projection_for(name, projection), delta.archived(name, p))
+        if got is not None:
+            got[1]["seconds"] = time.perf_counter() - t0
+            out[name] = got
+    return out
+
+def _write_table(df: pd.DataFrame, path: str):
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    tmp = path + ".tmp"
+    # Без сжатия: только так файл читается через memory_map без копирования
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+def write_snapshot(frames: Dict[str, Tuple[str, pd.DataFrame, dict]], compact: bool) -> int:
+    """
+    Записывает новое поколение снимка.
+    frames: {имя: (путь CSV, df, info загрузки)} — обычно только сущности, прочитанные не из снимка.
+    Возвращает новую версию данных снимка (0 — снимок не записан).
+    """
+    if not AVAILABLE or not frames:
+        return 0
+    from data.loader import _file_hash
+    # Имя поколения уникально по pid; версия и список сущностей берутся из манифеста под блокировкой
+    gen = f"gen-{int(read_manifest().get('data_version', 0)) + 1}-{os.getpid()}"
+    gen_dir = os.path.join(SNAPSHOT_DIR, gen)
+    t0 = time.perf_counter()
+    try:
+        os.makedirs(gen_dir, exist_ok=True)
+        written = {}
+        for name, (csv_path, df, info) in frames.items():
+            st = os.stat(csv_path)
+            _write_table(df, os.path.join(gen_dir, name + ".arrow"))
+            written[_entry_key(name, compact)] = {
+                "file": f"{gen}/{name}.arrow",
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "hash": _file_hash(csv_path),
+                "rows": len(df),
+                "compact": compact,
+                "projection": info.get("projection"),
+                "deltas": info.get("deltas", []),
+                "encoding": info.get("encoding"),
+                "sep": info.get("sep"),
+                "mem_before": info.get("mem_before"),
+                "mem_after": info.get("mem_after"),
+            }
+        path = _manifest_path()
+        with _manifest_locked():
+            # Перечитываем без кэша: другой процесс мог записать своё поколение, пока мы писали файлы
+            try:
+                manifest = _load_manifest(path)
+            except (OSError, ValueError):
+                manifest = {}
+            entities = dict(manifest.get("entities", {}), **written)
+            version = int(manifest.get("data_version", 0)) + 1
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"format": _FORMAT, "data_version": version,
+                           "created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "entities": entities},
+                          f, ensure_ascii=False, indent=2)
+            os.replace(tmp, path)
+    except Exception as e:
+        logger.warning("[DATA.SNAPSHOT.WRITE_FAIL] err=%s", e)
+        shutil.rmtree(gen_dir, ignore_errors=True)
+        return 0
+    logger.info("[DATA.SNAPSHOT.WRITE] version=%d entities=%s ms=%.0f",
+                version, list(frames), (time.perf_counter() - t0) * 1000)
+    _cleanup({e["file"].split("/", 1)[0] for e in entities.values()})
+    return version
+
+def publish(frames: Dict[str, Tuple[str, pd.DataFrame, dict]], compact: bool) -> Dict[str, Tuple[pd.DataFrame, dict]]:
+    """
+    Пишет сущности в снимок и сразу переоткрывает их оттуда: процесс, прочитавший CSV,
+    тоже переходит на общие отображённые страницы вместо собственной копии.
+    Возвращает {имя: (df, info)}; если записать не удалось — исходные DataFrame.
+    """
+    out = {name: (df, info) for name, (_, df, info) in frames.items()}
+    if not write_snapshot(frames, compact):
+        return out
+    for name, (csv_path, _, info) in frames.items():
+        got = open_entity(name, csv_path, compact, info.get("projection"), info.get("deltas"))
+        if got is not None:
+            # источник загрузки оставляем прежним (csv/cache) — для статистики попаданий
+            out[name] = (got[0], dict(info, snapshot_version=got[1].get("snapshot_version")))
+    return out
+
+def _cleanup(keep: set, min_age_sec: float = 60.0):
+    """
+    Удаляет поколения, на которые манифест больше не ссылается.
+    Свежие не трогаем — их может прямо сейчас дописывать другой процесс;
+    отображённые файлы на Windows не удалятся — пропускаем до следующего раза.
+    """
+    try:
+        names = os.listdir(SNAPSHOT_DIR)
+    except OSError:
+        return
+    now = time.time()
+    for d in names:
+        path = os.path.join(SNAPSHOT_DIR, d)
+        if not d.startswith("gen-") or d in keep:
+            continue
+        try:
+            if now - os.stat(path).st_mtime < min_age_sec:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
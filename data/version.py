@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Счётчики версий данных. Любая замена DataFrame (полная загрузка, горячая перезагрузка,
+дельта) поднимает общий DATA_VERSION и версию сущности — кэши ключуются по ним.
+Граф учитывается как сущность GRAPH_KEY.
+EntityCache — общий LRU производных структур по колонкам (индексы значений, подготовленные колонки).
+"""
+import time
+import weakref
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+GRAPH_KEY = "G"
+
+_LOCK = threading.Lock()
+DATA_VERSION = 0
+_ENTITY_VERSIONS: Dict[str, int] = {}
+
+def bump(entities: Optional[Iterable[str]] = None) -> int:
+    """Поднимает версию. entities=None — «всё поменялось» (полная перезагрузка)."""
+    global DATA_VERSION
+    with _LOCK:
+        DATA_VERSION += 1
+        if entities is None:
+            _ENTITY_VERSIONS.clear()
+            # сбрасываем на общий номер, чтобы старые ключи не совпали
+            _ENTITY_VERSIONS["*"] = DATA_VERSION
+        else:
+            for name in entities:
+                _ENTITY_VERSIONS[name] = DATA_VERSION
+        return DATA_VERSION
+
+def data_version() -> int:
+    return DATA_VERSION
+
+def entity_version(name: str) -> int:
+    with _LOCK:
+        return max(_ENTITY_VERSIONS.get(name, 0), _ENTITY_VERSIONS.get("*", 0))
+
+class EntityCache:
+    """
+    LRU (сущность, колонка) → объект, построенный по колонке DataFrame.
+    Запись действительна, пока не сменилась версия сущности и сам DataFrame (weakref).
+    maxsize <= 0 — ничего не храним, каждый запрос строит заново.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.stats = {"builds": 0, "hits": 0, "build_ms": 0.0}
+        self._items: "OrderedDict[Tuple[str, str], Tuple[int, weakref.ref, Any]]" = OrderedDict()
+
+    def get(self, entity: str, column: str, df, build: Callable[[], Any]) -> Tuple[Any, Optional[float]]:
+        """(объект, мс построения); мс = None — взят из кэша."""
+        key = (entity, column)
+        ver = entity_version(entity)
+        with self.lock:
+            got = self._items.get(key)
+            if got is not None and got[0] == ver and got[1]() is df:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return got[2], None
+        t0 = time.perf_counter()
+        obj = build()
+        ms = (time.perf_counter() - t0) * 1000
+        with self.lock:
+            if self.maxsize > 0:
+                self._items[key] = (ver, weakref.ref(df), obj)
+                self._items.move_to_end(key)
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+            self.stats["builds"] += 1
+            self.stats["build_ms"] += ms
+        return obj, ms
+
+    def values(self) -> List[Any]:
+        with self.lock:
+            return [v[2] for v in self._items.values()]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self):
+        with self.lock:
+            self._items.clear()
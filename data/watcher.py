@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Горячая перезагрузка ExportedData: фоновый поток опрашивает DATA_DIR (size+mtime),
+дожидается, пока выгрузка допишет файл (две одинаковые подписи подряд),
+перечитывает только изменённые сущности и атомарно подменяет их в реестре
+(DFS_REG и engine.repl.DF_ENV смотрят в один и тот же объект).
+После замены поднимается версия данных (data.version) — по ней сбрасываются кэши.
+Появление <Имя>.delta.csv / <Имя>.deleted.txt тоже считается изменением сущности (слияние — в load_entity).
+"""
+import os
+import glob
+import time
+import threading
+import logging
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Optional, Tuple
+from config import DATA_DIR, WATCH_INTERVAL_SEC, USE_SNAPSHOT, LOAD_COMPACT
+from data import version
+from data.delta import DELTA_SUFFIX, TOMBSTONE_SUFFIX, is_delta_path
+from data.registry import LazyFrames
+from data.snapshot import publish
+
+logger = logging.getLogger("ragos")
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def _entity_signature(name: str, path: str) -> Optional[tuple]:
+    """Подпись сущности: основной CSV + ожидающие дельты (None — файла нет)."""
+    sig = _signature(path)
+    if not sig:
+        return None
+    return (sig,) + tuple(_signature(os.path.join(DATA_DIR, name + s)) for s in (DELTA_SUFFIX, TOMBSTONE_SUFFIX))
+
+def _scan() -> Dict[str, Tuple[str, tuple]]:
+    out = {}
+    for p in glob.glob(os.path.join(DATA_DIR, "*.csv")):
+        if is_delta_path(p):
+            continue
+        name = os.path.splitext(os.path.basename(p))[0]
+        sig = _entity_signature(name, p)
+        if sig:
+            out[name] = (p, sig)
+    return out
+
+class DataWatcher(threading.Thread):
+    def __init__(self, dfs, interval: float = WATCH_INTERVAL_SEC,
+                 on_reload: Optional[Callable[[str, str], None]] = None):
+        super().__init__(name="ragos-data-watcher", daemon=True)
+        self.dfs = dfs
+        self.interval = interval
+        self.on_reload = on_reload
+        self._stop_event = threading.Event()
+        self._known = {name: sig for name, (_, sig) in _scan().items()}
+        self._pending: Dict[str, tuple] = {}
+        self._desc_sig = _signature(os.path.join(DATA_DIR, "описание.txt"))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.exception("[DATA.WATCH.ERROR] %s", e)
+
+    def poll(self):
+        """Один проход опроса (можно вызывать и вручную)."""
+        current = _scan()
+        for name, (path, sig) in current.items():
+            if self._known.get(name) == sig:
+                self._pending.pop(name, None)
+                continue
+            # Файл ещё может дописываться — ждём стабильной подписи
+            if self._pending.get(name) != sig:
+                self._pending[name] = sig
+                continue
+            self._pending.pop(name, None)
+            self._reload(name, path)
+            # Слияние переносит дельту в архив — запоминаем подпись уже после него
+            self._known[name] = _entity_signature(name, path) or sig
+        for name in [n for n in self._known if n not in current]:
+            self._known.pop(name)
+            self._pending.pop(name, None)
+            self._drop(name)
+
+        desc_sig = _signature(os.path.join(DATA_DIR, "описание.txt"))
+        if desc_sig != self._desc_sig:
+            self._desc_sig = desc_sig
+            from core.schema import load_schema
+            load_schema(force=True)
+            logger.info("[DATA.WATCH.SCHEMA] описание.txt перечитано")
+
+    def _reload(self, name: str, path: str):
+        from data.loader import load_entity
+        t0 = time.perf_counter()
+        if isinstance(self.dfs, LazyFrames) and not self.dfs.is_loaded(name):
+            # Ещё не загружена — достаточно сбросить заголовки, прочитается при обращении
+            self.dfs.replace(name, None, path)
+            source = "deferred"
+        else:
+            _, df, info = load_entity(path)
+            if USE_SNAPSHOT and info.get("source") != "snapshot":
+                # Обновляем общий снимок — другие процессы подхватят сущность без разбора CSV
+                df, info = publish({name: (path, df, info)}, LOAD_COMPACT)[name]
+            if isinstance(self.dfs, LazyFrames):
+                self.dfs.replace(name, df, path)
+            else:
+                self.dfs[name] = df
+            source = info.get("source", "csv")
+        ver = version.bump([name])
+        logger.info("[DATA.WATCH.RELOAD] entity=%s source=%s version=%d ms=%.0f",
+                    name, source, ver, (time.perf_counter() - t0) * 1000)
+        if self.on_reload:
+            self.on_reload(name, "reload")
+
+    def _drop(self, name: str):
+        if isinstance(self.dfs, LazyFrames):
+            self.dfs.discard(name)
+        elif isinstance(self.dfs, MutableMapping):
+            self.dfs.pop(name, None)
+        ver = version.bump([name])
+        logger.info("[DATA.WATCH.DROP] entity=%s version=%d", name, ver)
+        if self.on_reload:
+            self.on_reload(name, "drop")
+
+def start_watcher(dfs, interval: float = WATCH_INTERVAL_SEC,
+                  on_reload: Optional[Callable[[str, str], None]] = None) -> DataWatcher:
+    w = DataWatcher(dfs, interval=interval, on_reload=on_reload)
+    w.start()
+    return w
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Разбор автокода по AST вместо подстрочных проверок и регулярок.
+Один проход ast.parse на уникальный код (вердикт кэшируется по хэшу текста):
+  - df_* имена, обращение к графу G, литеральные колонки df_X['Колонка'] / df_X[['A', 'B']];
+  - запрещённые конструкции: import (кроме pandas — pd и так есть в окружении),
+    атрибуты/имена с двойным подчёркиванием, ввод-вывод (open, read_*, to_csv …), eval/exec —
+    и вызовом, и как значение (псевдоним f = open, элемент списка/словаря).
+Регрессия разбора: python -m engine.analysis check.
+Использует python_repl_tool (_prepare) и templates_ai.validate_code_uses_existing.
+"""
+import re
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Mapping, NamedTuple, Optional, Tuple
+from config import REPL_CODE_CACHE_SIZE
+
+# Метка авто-кода (без перевода строки здесь!)
+MAGIC = "# RAGOS_AUTOCODE"
+
+_ALLOWED_IMPORTS = {"pandas"}
+_FORBIDDEN_CALLS = {"open", "exec", "eval", "compile", "input", "getattr", "setattr", "delattr",
+                    "globals", "locals", "vars", "breakpoint", "help", "memoryview"}
+# Методы pandas, которые пишут файлы (чтение — любые read_*, см. _is_io_attr);
+# os/файловые объекты недостижимы: import и open запрещены
+_IO_ATTRS = {"to_csv", "to_excel", "to_json", "to_parquet", "to_pickle", "to_feather", "to_hdf",
+             "to_sql", "to_stata", "to_html", "to_xml", "to_latex", "to_clipboard", "to_orc"}
+
+class CodeAnalysis(NamedTuple):
+    ok: bool
+    error: str                              # причина отказа — текст для пользователя
+    source: str                             # код без ``` и строк import pandas
+    tree: Optional[ast.Module]              # AST — compile без повторного разбора
+    df_names: Tuple[str, ...]               # упомянутые df_*
+    columns: Tuple[Tuple[str, str], ...]    # (df_X, колонка) из литеральных индексов
+    uses_graph: bool
+    norm_key: str                           # хэш нормализованного кода (без комментариев и форматирования)
+
+def _strip_code_fences(code: str) -> str:
+    code = code.strip()
+    if code.startswith("```"):
+        first_nl = code.find("\n")
+        code = code[first_nl + 1:] if first_nl >= 0 else ""
+        if code.rstrip().endswith("```"):
+            code = code.rstrip()[:-3]
+    return code.strip()
+
+def _patch_code(code: str) -> str:
+    # Мини-фиксы опечаток
+    code = re.sub(r"```math'([^'```]+)'```'```", r"['\1']", code)
+    code = re.sub(r"```\s*```\s*==", r"] ==", code)
+    # Если после MAGIC сразу идёт код без перевода строки — вставим (иначе код уйдёт в комментарий)
+    if code.startswith(MAGIC) and not code.startswith(MAGIC + "\n"):
+        code = code.replace(MAGIC, MAGIC + "\n", 1)
+    return code
+
+def _is_io_attr(name: str) -> bool:
+    return name.startswith("read_") or name in _IO_ATTRS
+
+def _is_dunder(name: str) -> bool:
+    return name.startswith("__") and name.endswith("__")
+
+def _subscript_columns(node: ast.Subscript):
+    sl = node.slice
+    if isinstance(sl, ast.Constant) and isinstance(sl.value, str):
+        return [sl.value]
+    if isinstance(sl, (ast.List, ast.Tuple)) and sl.elts and all(
+            isinstance(e, ast.Constant) and isinstance(e.value, str) for e in sl.elts):
+        return [e.value for e in sl.elts]
+    return []
+
+class _Visitor(ast.NodeVisitor):
+    def __init__(self):
+        self.error = ""
+        self.df_names = set()
+        self.columns = []
+        self.uses_graph = False
+
+    def _reject(self, msg: str):
+        if not self.error:
+            self.error = msg
+
+    def visit_Import(self, node: ast.Import):
+        mods = sorted({a.name.split(".")[0] for a in node.names})
+        self._reject(f"🚫 Импорт модулей запрещён: {', '.join(mods)}.")
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        self._reject(f"🚫 Импорт модулей запрещён: {node.module or '.'}.")
+
+    def visit_Name(self, node: ast.Name):
+        if _is_dunder(node.id):
+            self._reject(f"🚫 Обращение к служебному имени {node.id} запрещено.")
+        elif node.id in _FORBIDDEN_CALLS and isinstance(node.ctx, ast.Load):
+            # f = open; f(...) / [getattr][0](...) — запрещённое имя нельзя даже взять как значение
+            self._reject(f"🚫 Использование {node.id} запрещено.")
+        elif node.id.startswith("df_"):
+            self.df_names.add(node.id)
+        elif node.id == "G":
+            self.uses_graph = True
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if _is_dunder(node.attr):
+            self._reject(f"🚫 Обращение к служебному атрибуту {node.attr} запрещено.")
+        elif _is_io_attr(node.attr):
+            if node.attr == "read_csv":
+                self._reject("🚫 Чтение CSV запрещено. Используй уже загруженные df_<ИмяСправочника>.")
+            else:
+                self._reject(f"🚫 Ввод-вывод запрещён: .{node.attr}().")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Name) and node.func.id in _FORBIDDEN_CALLS:
+            self._reject(f"🚫 Вызов {node.func.id}() запрещён.")
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node: ast.Subscript):
+        if isinstance(node.value, ast.Name) and node.value.id.startswith("df_"):
+            for col in _subscript_columns(node):
+                self.columns.append((node.value.id, col))
+        self.generic_visit(node)
+
+def _harmless_import(node) -> bool:
+    """import pandas [as pd] верхнего уровня — лишний, но безвредный: pd уже есть в окружении."""
+    return isinstance(node, ast.Import) and all(
+        a.name.split(".")[0] in _ALLOWED_IMPORTS and a.asname in (None, "pd") for a in node.names)
+
+def _key(code: str) -> str:
+    return hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+def _analyze(code: str) -> CodeAnalysis:
+    source = _patch_code(_strip_code_fences(code))
+    try:
+        tree = ast.parse(source, "<ragos-autocode>", "exec")
+    except SyntaxError as e:
+        return CodeAnalysis(False, f"Ошибка выполнения Python-кода: {e}", source, None, (), (), False, "")
+    drop = [n for n in tree.body if _harmless_import(n)]
+    if drop:
+        skip = {i for n in drop for i in range(n.lineno, n.end_lineno + 1)}
+        source = "\n".join(l for i, l in enumerate(source.splitlines(), start=1) if i not in skip)
+        tree.body = [n for n in tree.body if not _harmless_import(n)]
+    v = _Visitor()
+    v.visit(tree)
+    if v.error:
+        return CodeAnalysis(False, v.error, source, None, (), (), False, "")
+    return CodeAnalysis(True, "", source, tree, tuple(sorted(v.df_names)), tuple(dict.fromkeys(v.columns)),
+                        v.uses_graph, _key(ast.dump(tree)))
+
+# LRU: хэш исходного текста → CodeAnalysis
+_CACHE: "OrderedDict[str, CodeAnalysis]" = OrderedDict()
+_LOCK = threading.Lock()
+STATS = {"hits": 0, "misses": 0, "rejected": 0}
+
+def analyze(code: str) -> CodeAnalysis:
+    """Вердикт для кода (из кэша, если такой текст уже разбирали)."""
+    key = _key(code)
+    with _LOCK:
+        got = _CACHE.get(key)
+        if got is not None:
+            _CACHE.move_to_end(key)
+            STATS["hits"] += 1
+            return got
+    res = _analyze(code)
+    with _LOCK:
+        STATS["misses"] += 1
+        STATS["rejected"] += 0 if res.ok else 1
+        if REPL_CODE_CACHE_SIZE > 0:
+            _CACHE[key] = res
+            while len(_CACHE) > REPL_CODE_CACHE_SIZE:
+                _CACHE.popitem(last=False)
+    return res
+
+def cache_stats() -> dict:
+    with _LOCK:
+        return dict(STATS, size=len(_CACHE))
+
+def validate_frames(dfs: Mapping, code: str) -> Tuple[bool, str]:
+    """Код допустим, его df_* есть в dfs, литеральные колонки — в этих датафреймах (без загрузки данных)."""
+    from data.registry import frame_columns
+    a = analyze(code)
+    if not a.ok:
+        return False, a.error
+    for var in a.df_names:
+        if var[3:] not in dfs:
+            return False, f"⚠ В коде используется неизвестный датафрейм {var}"
+    columns = {}
+    for var, col in a.columns:
+        ent = var[3:]
+        if ent not in columns:
+            columns[ent] = set(frame_columns(dfs, ent))
+        if col not in columns[ent]:
+            return False, f"⚠ В {var} не найдена колонка «{col}»"
+    return True, ""
+
+# (код, допустим ли) — регрессия для python -m engine.analysis check
+_CHECK_CASES = [
+    ("result = len(df_Проекты[df_Проекты['Наименование'] == 'X'])", True),
+    ("import pandas as pd\nresult = 1", True),
+    ("import os\nresult = 1", False),
+    ("result = open('a.txt').read()", False),
+    ("f = open\nresult = f('a.txt').read()", False),
+    ("g = [getattr][0]\nresult = g(df_Проекты, 'to_csv')", False),
+    ("result = {'f': eval}['f']('1 + 1')", False),
+    ("result = ().__class__", False),
+    ("result = df_Проекты['Наименование'].to_csv('o.csv')", False),
+    ("result = pd.read_csv('x.csv')", False),
+    ("open_count = 1\nresult = open_count", True),
+]
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Разбор автокода")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("check", help="регрессия: допустимый и запрещённый код")
+    parser.parse_args()
+    failed = 0
+    for code, expected in _CHECK_CASES:
+        got = _analyze(f"{MAGIC}\n{code}")
+        mark = "✅" if got.ok == expected else "❌"
+        failed += got.ok != expected
+        print(f"{mark} {'ok' if got.ok else got.error}  ← {code!r}")
+    raise SystemExit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+План запроса для роутера и DSL-шаблонов: фильтры → проекция → агрегат.
+Вместо сборки строки pandas-кода и exec план исполняется прямо над данными:
+равенства берут позиции строк из индекса значений (data.index) и идут по возрастанию частоты
+значения (оценка селективности): начинаем с самого узкого набора позиций и пересекаем его
+с остальными, пустое пересечение прерывает цепочку. Прочие фильтры (!=, in, без индекса)
+проверяются только на оставшихся строках — векторной маской (для Categorical — по кодам).
+Код через python_repl_tool остаётся только для свободных LLM-шаблонов.
+Отладка: Plan.explain(df) — шаги плана с числом строк после каждого фильтра;
+verify(plan, df) / PLAN_VERIFY — сверка с обычной pandas-маской;
+python -m engine.plan check Проекты "Контрагент_Наименование=X" "Подразделение_Наименование=Y".
+"""
+import time
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+import numpy as np
+import pandas as pd
+import state
+from config import REPL_RESULT_CACHE_SIZE, PLAN_VERIFY
+from data import version
+from data.index import get_index
+from engine.repl import _result_get, _result_put, _MISSING
+from engine.result import ReplResult
+from engine import profile
+
+logger = logging.getLogger("ragos")
+
+_OPS = ("==", "!=", "in")
+_AGGREGATES = ("count", "list")
+
+@dataclass(frozen=True)
+class Filter:
+    column: str
+    value: Any
+    op: str = "=="              # "==" | "!=" | "in" (value — кортеж)
+
+    def __str__(self) -> str:
+        return f"{self.column} {self.op} {self.value!r}"
+
+@dataclass(frozen=True)
+class Plan:
+    entity: str
+    filters: Tuple[Filter, ...] = ()
+    aggregate: str = "count"    # "count" | "list"
+    project: Optional[str] = None   # колонка для list (по умолчанию Наименование/GUID)
+
+    def __post_init__(self):
+        if self.aggregate not in _AGGREGATES:
+            raise ValueError(f"неизвестная операция плана: {self.aggregate}")
+        for f in self.filters:
+            if f.op not in _OPS:
+                raise ValueError(f"неизвестный оператор фильтра: {f.op}")
+
+    def key(self) -> str:
+        """Ключ кэша результатов (общий с автокодом, engine.repl)."""
+        raw = repr((self.entity, self.filters, self.aggregate, self.project))
+        return "plan:" + hashlib.blake2b(raw.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def explain(self, df: Optional[pd.DataFrame] = None) -> str:
+        """Текстовое описание плана; с df — шаги в порядке исполнения, способ и сколько строк остаётся после каждого."""
+        lines = [f"План: {self.aggregate} по «{self.entity}»"]
+        if df is None:
+            lines += [f"  {i}) фильтр {f}" for i, f in enumerate(self.filters, start=1)]
+        else:
+            trace = []
+            _candidates(self, df, trace)
+            for i, (f, how, left, ms) in enumerate(trace, start=1):
+                lines.append(f"  {i}) фильтр {f}  [{how}; осталось {left} из {len(df)}; {ms:.1f} мс]")
+            if len(trace) < len(self.filters):
+                lines.append("  … остальные фильтры не проверялись: строк не осталось")
+        if self.aggregate == "list":
+            lines.append(f"  → список «{self.project or _default_project(df)}»")
+        else:
+            lines.append("  → количество строк")
+        return "\n".join(lines)
+
+def _default_project(df: Optional[pd.DataFrame]) -> str:
+    if df is None or "Наименование" in df.columns:
+        return "Наименование"
+    return "GUID"
+
+def filter_mask(df: pd.DataFrame, f: Filter) -> np.ndarray:
+    """Булева маска одного фильтра (numpy, без NA)."""
+    return series_mask(df[f.column], f)
+
+def series_mask(s: pd.Series, f: Filter) -> np.ndarray:
+    """Маска фильтра по колонке или её части (строки-кандидаты)."""
+    values = tuple(f.value) if f.op == "in" else (f.value,)
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Сравнение целочисленных кодов вместо строк; значения нет среди категорий — пустая маска
+        idx = s.cat.categories.get_indexer(pd.Index(values, dtype=object))
+        idx = idx[idx >= 0]
+        codes = s.cat.codes.to_numpy()
+        mask = (codes == idx[0]) if len(idx) == 1 else np.isin(codes, idx)
+    elif f.op == "in":
+        mask = s.isin(values).to_numpy(dtype=bool, na_value=False)
+    else:
+        mask = (s == f.value).to_numpy(dtype=bool, na_value=False)
+    return ~mask if f.op == "!=" else mask
+
+def _intersect(a: np.ndarray, b: np.ndarray, rows: int) -> np.ndarray:
+    """Пересечение отсортированных массивов позиций. Меньший ищется в большем бинарным поиском
+    (O(k·log m)); если оба крупные — через битовую карту длиной в таблицу (O(строк))."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    if len(a) * max(1, int(np.log2(len(b)))) > rows:
+        bitmap = np.zeros(rows, dtype=bool)
+        bitmap[b] = True
+        return a[bitmap[a]]
+    i = np.searchsorted(b, a)
+    np.minimum(i, len(b) - 1, out=i)
+    return a[b[i] == a]
+
+def _candidates(plan: Plan, df: pd.DataFrame, trace: Optional[list] = None) -> Optional[np.ndarray]:
+    """Позиции строк (по возрастанию), прошедших все фильтры; None — фильтров нет.
+    trace — список для explain: (фильтр, способ, осталось строк, мс) в порядке исполнения."""
+    if not plan.filters:
+        return None
+    indexed, rest = [], []
+    for f in plan.filters:
+        idx = get_index(plan.entity, f.column, df) if f.op == "==" else None
+        if idx is not None:
+            indexed.append((idx.count(f.value), f, idx))
+        else:
+            rest.append(f)
+    # Селективность — по частоте значения в индексе: от самого редкого к самому частому
+    indexed.sort(key=lambda t: t[0])
+    pos = None
+    for est, f, idx in indexed:
+        t0 = time.perf_counter()
+        p = idx.positions(f.value)
+        pos = p if pos is None else _intersect(pos, p, len(df))
+        if trace is not None:
+            trace.append((f, f"индекс значений, частота {est}", len(pos), (time.perf_counter() - t0) * 1000))
+        if not len(pos):
+            return pos
+    for f in rest:
+        t0 = time.perf_counter()
+        s = df[f.column]
+        if pos is None:
+            pos = np.flatnonzero(series_mask(s, f))
+        else:
+            pos = pos[series_mask(s.take(pos), f)]
+        if trace is not None:
+            how = "коды категорий" if isinstance(s.dtype, pd.CategoricalDtype) else "значения"
+            trace.append((f, how, len(pos), (time.perf_counter() - t0) * 1000))
+        if not len(pos):
+            return pos
+    return pos
+
+def execute(plan: Plan, df: pd.DataFrame, prof=None):
+    """Исполняет план над df. count → int, list → list значений колонки проекции."""
+    prof = prof or profile.NOOP
+    with prof.phase("mask"):
+        pos = _candidates(plan, df)
+    with prof.phase("collect"):
+        if plan.aggregate == "count":
+            return len(df) if pos is None else len(pos)
+        s = df[plan.project or _default_project(df)]
+        if pos is None:
+            return s.tolist()
+        return s.take(pos).tolist()
+
+def reference(plan: Plan, df: pd.DataFrame):
+    """Эталон: тот же план обычной pandas-маской по строковому виду колонок, без индексов."""
+    mask = np.ones(len(df), dtype=bool)
+    for f in plan.filters:
+        s = df[f.column].astype(object).fillna("").astype(str)
+        if f.op == "in":
+            m = s.isin([str(v) for v in f.value])
+        else:
+            m = s == str(f.value)
+        m = m.to_numpy(dtype=bool)
+        mask &= ~m if f.op == "!=" else m
+    if plan.aggregate == "count":
+        return int(mask.sum())
+    return df.loc[mask, plan.project or _default_project(df)].tolist()
+
+def verify(plan: Plan, df: pd.DataFrame) -> bool:
+    """Совпадает ли execute с эталоном; расхождение пишется в лог."""
+    got, want = execute(plan, df), reference(plan, df)
+    if got != want:
+        logger.warning("[CODE.PLAN.MISMATCH] entity=%s filters=%s plan=%s pandas=%s", plan.entity,
+                       "; ".join(map(str, plan.filters)), got if plan.aggregate == "count" else len(got),
+                       want if plan.aggregate == "count" else len(want))
+        return False
+    return True
+
+def run_plan(plan: Plan, dfs) -> str:
+    """Исполняет план и возвращает текст ответа — как python_repl_tool (кэш результатов, state.LastResult)."""
+    prof = profile.start("plan")
+    out = _run_plan(plan, dfs, prof)
+    prof.finish(out)
+    return out
+
+def _run_plan(plan: Plan, dfs, prof) -> str:
+    logger.info("[CODE.PLAN.EXEC] entity=%s filters=%s aggregate=%s", plan.entity,
+                "; ".join(map(str, plan.filters)) or "-", plan.aggregate)
+    try:
+        if plan.entity not in dfs:
+            return f"⚠ Не найден датафрейм df_{plan.entity}."
+        t0 = time.perf_counter()
+        versions = (version.entity_version(plan.entity),) if REPL_RESULT_CACHE_SIZE > 0 else None
+        key = plan.key()
+        result = _result_get(key, versions) if versions is not None else _MISSING
+        cache_state = "hit" if result is not _MISSING else ("miss" if versions is not None else "off")
+        if result is _MISSING:
+            result = execute(plan, dfs[plan.entity], prof)
+            if PLAN_VERIFY:
+                verify(plan, dfs[plan.entity])
+            if versions is not None:
+                _result_put(key, versions, result)
+        prof.result(result, cache_state)
+        with prof.phase("format"):
+            state.LastCode = plan.explain()
+            res = ReplResult.wrap(result)
+            logger.info("[CODE.PLAN.RESULT] type=%s %s cache=%s ms=%.1f", res.kind,
+                        f"size={res.length}" if res.paged else f"value={result}", cache_state,
+                        (time.perf_counter() - t0) * 1000)
+            state.LastResult = res
+            return res.preview_text()
+    except Exception as e:
+        return f"Ошибка выполнения запроса: {e}"
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Проверка плана запроса на данных")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_chk = sub.add_parser("check", help="план против обычной pandas-маски")
+    p_chk.add_argument("entity")
+    p_chk.add_argument("filters", nargs="+", help="Колонка=Значение")
+    p_chk.add_argument("--list", action="store_true", help="список вместо количества")
+    args = parser.parse_args()
+    from data.loader import load_dataframes
+    dfs = load_dataframes(lazy=True)
+    if args.entity not in dfs:
+        raise SystemExit(f"⚠ Не найден датафрейм df_{args.entity}.")
+    df = dfs[args.entity]
+    plan = Plan(args.entity, tuple(Filter(*f.split("=", 1)) for f in args.filters),
+                "list" if args.list else "count")
+    print(plan.explain(df))
+    got, want = execute(plan, df), reference(plan, df)
+    size = (lambda r: r) if plan.aggregate == "count" else len
+    print(f"план: {size(got)}; pandas: {size(want)} — {'совпадает' if got == want else 'РАСХОЖДЕНИЕ'}")
+    raise SystemExit(0 if got == want else 1)
+
+if __name__ == "__main__":
+    main()
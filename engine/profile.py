@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Профилирование исполнения автокода и планов (REPL_PROFILE, по умолчанию выключено).
+На каждый вызов python_repl_tool / run_plan пишется строка JSONL (REPL_PROFILE_FILE, с ротацией):
+  tag       — id шаблона (tpl:<id>, dsl:<имя>) или путь роутера (router:count.single …)
+  path      — repl | plan
+  wall_ms, cpu_ms — общее время и CPU текущего потока (в пуле процессов CPU воркера не виден)
+  peak_kb   — пик выделенной памяти за вызов (tracemalloc)
+  phases    — мс по фазам: prepare/exec (автокод), mask/collect (план: маски, .tolist()), format (текст ответа)
+  result_type, result_len, text_len, cache
+Сводка p50/p95/p99 по шаблонам: python -m engine.profile summary
+"""
+import os
+import json
+import time
+import logging
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+from config import REPL_PROFILE, REPL_PROFILE_FILE, REPL_PROFILE_MAX_MB, REPL_PROFILE_BACKUPS
+
+logger = logging.getLogger("ragos")
+
+_TAG: contextvars.ContextVar = contextvars.ContextVar("ragos_profile_tag", default=None)
+_ENABLED = bool(REPL_PROFILE)
+_WRITER: Optional[logging.Logger] = None
+
+def enable(flag: bool = True):
+    """Включить/выключить профилирование на лету (без перезапуска)."""
+    global _ENABLED
+    _ENABLED = bool(flag)
+    if _ENABLED and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def enabled() -> bool:
+    return _ENABLED
+
+@contextmanager
+def tagged(tag: str):
+    """Помечает вызовы внутри блока: with tagged(f"tpl:{tpl['id']}"): python_repl_tool(...)."""
+    token = _TAG.set(tag)
+    try:
+        yield
+    finally:
+        _TAG.reset(token)
+
+def _writer() -> logging.Logger:
+    global _WRITER
+    if _WRITER is None:
+        os.makedirs(os.path.dirname(REPL_PROFILE_FILE) or ".", exist_ok=True)
+        w = logging.getLogger("ragos.profile")
+        w.propagate = False
+        w.setLevel(logging.INFO)
+        h = RotatingFileHandler(REPL_PROFILE_FILE, maxBytes=int(REPL_PROFILE_MAX_MB * 1024 * 1024),
+                                backupCount=REPL_PROFILE_BACKUPS, encoding="utf-8")
+        h.setFormatter(logging.Formatter("%(message)s"))
+        w.addHandler(h)
+        _WRITER = w
+    return _WRITER
+
+class _Call:
+    """Замер одного вызова; фазы — через with call.phase("exec")."""
+    def __init__(self, path: str):
+        self.rec = {"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "tag": _TAG.get() or path, "path": path,
+                    "phases": {}, "cache": None, "result_type": None, "result_len": None}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._mem0 = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self._cpu0 = time.thread_time()
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ph = self.rec["phases"]
+            ph[name] = round(ph.get(name, 0.0) + (time.perf_counter() - t0) * 1000, 3)
+
+    def result(self, value, cache: Optional[str] = None):
+        self.rec["result_type"] = type(value).__name__
+        try:
+            self.rec["result_len"] = len(value) if not isinstance(value, (str, bytes)) else None
+        except TypeError:
+            pass
+        self.rec["cache"] = cache
+
+    def finish(self, text: Optional[str] = None):
+        self.rec["wall_ms"] = round((time.perf_counter() - self._t0) * 1000, 3)
+        self.rec["cpu_ms"] = round((time.thread_time() - self._cpu0) * 1000, 3)
+        self.rec["peak_kb"] = round(max(0, tracemalloc.get_traced_memory()[1] - self._mem0) / 1024, 1)
+        self.rec["text_len"] = len(text) if text is not None else None
+        try:
+            _writer().info(json.dumps(self.rec, ensure_ascii=False, default=str))
+        except Exception as e:
+            logger.warning("[CODE.PROFILE.WRITE_FAIL] err=%s", e)
+
+class _NoCall:
+    """Профилирование выключено — все методы ничего не делают."""
+    @contextmanager
+    def phase(self, name: str):
+        yield
+
+    def result(self, value, cache: Optional[str] = None):
+        pass
+
+    def finish(self, text: Optional[str] = None):
+        pass
+
+NOOP = _NoCall()
+
+def start(path: str):
+    return _Call(path) if _ENABLED else NOOP
+
+# --- Сводка ---
+
+def read_records(path: str = REPL_PROFILE_FILE) -> List[dict]:
+    """Записи из файла и его ротированных копий (старые — первыми)."""
+    files = [f"{path}.{i}" for i in range(REPL_PROFILE_BACKUPS, 0, -1)] + [path]
+    out = []
+    for p in files:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    continue
+    return out
+
+def _pct(values: List[float], q: float) -> float:
+    import numpy as np
+    return float(np.percentile(values, q)) if values else 0.0
+
+def summarize(records: List[dict]) -> Dict[str, dict]:
+    """{tag: {n, wall p50/p95/p99, cpu_p95, peak_kb_p95, фазы p95}} — по убыванию wall p95."""
+    groups: Dict[str, List[dict]] = {}
+    for r in records:
+        groups.setdefault(r.get("tag") or "?", []).append(r)
+    out = {}
+    for tag, rs in groups.items():
+        wall = [r.get("wall_ms", 0.0) for r in rs]
+        phases = {}
+        for r in rs:
+            for k, v in (r.get("phases") or {}).items():
+                phases.setdefault(k, []).append(v)
+        out[tag] = {
+            "n": len(rs),
+            "p50": _pct(wall, 50), "p95": _pct(wall, 95), "p99": _pct(wall, 99),
+            "cpu_p95": _pct([r.get("cpu_ms", 0.0) for r in rs], 95),
+            "peak_kb_p95": _pct([r.get("peak_kb", 0.0) for r in rs], 95),
+            "phases_p95": {k: _pct(v, 95) for k, v in phases.items()},
+            "cache_hits": sum(1 for r in rs if r.get("cache") == "hit"),
+        }
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["p95"]))
+
+def format_summary(summary: Dict[str, dict]) -> str:
+    if not summary:
+        return "ℹ Нет записей профилирования (включите REPL_PROFILE)."
+    lines = [f"{'шаблон':40} {'n':>6} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'CPU p95':>9} {'пик КБ':>9}  фазы p95"]
+    for tag, s in summary.items():
+        phases = " ".join(f"{k}={v:.1f}" for k, v in s["phases_p95"].items())
+        lines.append(f"{tag[:40]:40} {s['n']:>6} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} "
+                     f"{s['cpu_p95']:>9.1f} {s['peak_kb_p95']:>9.0f}  {phases}")
+    return "\n".join(lines)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Профиль исполнения автокода")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_sum = sub.add_parser("summary", help="p50/p95/p99 по шаблонам")
+    p_sum.add_argument("--file", default=REPL_PROFILE_FILE)
+    p_sum.add_argument("--tag", default=None, help="только теги, начинающиеся с этой строки")
+    args = parser.parse_args()
+    records = read_records(args.file)
+    if args.tag:
+        records = [r for r in records if str(r.get("tag", "")).startswith(args.tag)]
+    print(format_summary(summarize(records)))
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,35 @@
 # -*- coding: utf-8 -*-
-import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import NamedTuple, Optional, Tuple
 import pandas as pd
 import state
 import logging
-
-DF_ENV: dict[str, pd.DataFrame] = {}
+from config import REPL_CODE_CACHE_SIZE, REPL_RESULT_CACHE_SIZE, REPL_ISOLATION
+from data import version, guid
+from engine.result import ReplResult
+from engine import profile, analysis
+from engine.analysis import MAGIC
+
+class _DfEnv(Mapping):
+    """df_<Имя> → dfs[<Имя>]: представление без материализации всех сущностей (для ленивого реестра)."""
+    def __init__(self, dfs_by_name: Mapping):
+        self._dfs = dfs_by_name
+    def __getitem__(self, key: str) -> pd.DataFrame:
+        if not key.startswith("df_"):
+            raise KeyError(key)
+        return self._dfs[key[3:]]
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and key.startswith("df_") and key[3:] in self._dfs
+    def __iter__(self):
+        return (f"df_{name}" for name in self._dfs)
+    def __len__(self) -> int:
+        return len(self._dfs)
+
+DF_ENV: Mapping = _DfEnv({})
 G_ENV = None
 
 SAFE_BUILTINS = {
@@ -13,88 +38,201 @@ SAFE_BUILTINS = {
     "enumerate": enumerate, "zip": zip
 }
 logger = logging.getLogger("ragos")
-# Метка авто-кода (без перевода строки здесь!)
-MAGIC = "# RAGOS_AUTOCODE"
 
 def register_dataframes(dfs_by_name: dict):
     global DF_ENV
-    DF_ENV = {f"df_{name}": df for name, df in dfs_by_name.items()}
+    DF_ENV = _DfEnv(dfs_by_name)
+    version.bump()
 
 def register_graph(G):
     global G_ENV
     G_ENV = G
-
-def _strip_code_fences(code: str) -> str:
-    code = code.strip()
-    if code.startswith("```"):
-        code = re.sub(r'^```[^\n]*\n', '', code, flags=re.DOTALL)
-        code = re.sub(r'\n?```$', '', code)
-    return code.strip()
-
-def _sanitize_code(code: str) -> str:
-    code = _strip_code_fences(code)
-    lines = []
-    for line in code.splitlines():
-        s = line.strip()
-        if s.startswith("import ") or s.startswith("from "):
-            continue
-        lines.append(line)
-    code = "\n".join(lines)
-    if "read_csv" in code.lower() or ".csv" in code.lower():
-        return "RAISE: CSV_IO_FORBIDDEN"
-    return code
-
-def _patch_code(code: str) -> str:
-    # Мини-фиксы опечаток
-    code = re.sub(r"```math'([^'```]+)'```'```", r"['\1']", code)
-    code = re.sub(r"```\s*```\s*==", r"] ==", code)
-    return code
-
-def python_repl_tool(code: str) -> str:
-    logger.info("[CODE.REPL.CALL] guard=%s len=%d", code.strip().startswith(MAGIC), len(code))
+    version.bump([version.GRAPH_KEY])
+
+class _Compiled(NamedTuple):
+    source: str                 # код после санитайза/патчей (для state.LastCode и логов)
+    code: object                # объект кода для exec
+    df_names: Tuple[str, ...]   # упомянутые df_*
+    norm_key: str               # хэш нормализованного кода — ключ кэша результатов
+    uses_graph: bool            # код обращается к G
+
+# LRU: хэш исходного текста → скомпилированный код; повторный шаблон не проходит текстовую обработку
+_CODE_CACHE: "OrderedDict[str, _Compiled]" = OrderedDict()
+_CODE_CACHE_LOCK = threading.Lock()
+CODE_CACHE_STATS = {"hits": 0, "misses": 0, "compile_ms": 0.0}
+
+# Кэш результатов: норм. код → (версии данных, result). Перезагрузка данных поднимает версию
+# (data.version) — запись с устаревшими версиями при обращении выбрасывается.
+_RESULT_CACHE: "OrderedDict[str, Tuple[tuple, object]]" = OrderedDict()
+RESULT_CACHE_STATS = {"hits": 0, "misses": 0, "invalidated": 0}
+
+def _code_key(code: str) -> str:
+    return hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+def _cache_get(key: str) -> Optional[_Compiled]:
+    with _CODE_CACHE_LOCK:
+        entry = _CODE_CACHE.get(key)
+        if entry is not None:
+            _CODE_CACHE.move_to_end(key)
+            CODE_CACHE_STATS["hits"] += 1
+        return entry
+
+def _cache_put(key: str, entry: _Compiled, compile_ms: float):
+    with _CODE_CACHE_LOCK:
+        CODE_CACHE_STATS["misses"] += 1
+        CODE_CACHE_STATS["compile_ms"] += compile_ms
+        if REPL_CODE_CACHE_SIZE <= 0:
+            return
+        _CODE_CACHE[key] = entry
+        while len(_CODE_CACHE) > REPL_CODE_CACHE_SIZE:
+            _CODE_CACHE.popitem(last=False)
+
+def code_cache_stats() -> dict:
+    with _CODE_CACHE_LOCK:
+        return dict(CODE_CACHE_STATS, size=len(_CODE_CACHE))
+
+def clear_code_cache():
+    with _CODE_CACHE_LOCK:
+        _CODE_CACHE.clear()
+
+def _data_versions(entry: _Compiled) -> tuple:
+    versions = tuple(version.entity_version(name[3:]) for name in entry.df_names)
+    if entry.uses_graph:
+        versions += (version.entity_version(version.GRAPH_KEY),)
+    return versions
+
+_MISSING = object()
+
+def _result_get(key: str, versions: tuple):
+    """key — _Compiled.norm_key или ключ плана (engine.plan)."""
+    with _CODE_CACHE_LOCK:
+        cached = _RESULT_CACHE.get(key)
+        if cached is None:
+            RESULT_CACHE_STATS["misses"] += 1
+            return _MISSING
+        if cached[0] != versions:
+            del _RESULT_CACHE[key]
+            RESULT_CACHE_STATS["invalidated"] += 1
+            RESULT_CACHE_STATS["misses"] += 1
+            return _MISSING
+        _RESULT_CACHE.move_to_end(key)
+        RESULT_CACHE_STATS["hits"] += 1
+        return cached[1]
+
+def _result_put(key: str, versions: tuple, result):
+    with _CODE_CACHE_LOCK:
+        _RESULT_CACHE[key] = (versions, result)
+        while len(_RESULT_CACHE) > REPL_RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+
+def result_cache_stats() -> dict:
+    with _CODE_CACHE_LOCK:
+        return dict(RESULT_CACHE_STATS, size=len(_RESULT_CACHE))
+
+def clear_result_cache():
+    with _CODE_CACHE_LOCK:
+        _RESULT_CACHE.clear()
+
+def _prepare(code: str):
+    """Разбор (engine.analysis, кэш вердиктов) + compile из готового AST. Возвращает _Compiled или строку-отказ."""
     # Разрешаем только автокод
     if not code.strip().startswith(MAGIC):
         return "🚫 Этот инструмент исполняет только код, сгенерированный шаблонами."
-    if "pyodbc" in code.lower() or "select " in code.lower():
-        return "🚫 SQL и pyodbc запрещены."
+    a = analysis.analyze(code)
+    if not a.ok:
+        return a.error
+    return _Compiled(a.source, compile(a.tree, "<ragos-autocode>", "exec"),
+                     a.df_names, a.norm_key, a.uses_graph)
+
+def build_env(df_names) -> dict:
+    """Окружение exec: pd, только упомянутые df_* (ленивый реестр не грузит лишнего) и граф."""
+    env = {"pd": pd}
+    for var in df_names:
+        if var in DF_ENV:
+            env[var] = DF_ENV[var]
+    if G_ENV is not None:
+        # Узлы графа — 128-битные int: guid_key("...") → ключ, guid_str(ключ) → строка
+        env["G"] = G_ENV
+        env["guid_key"] = guid.to_key
+        env["guid_str"] = guid.to_str
+    return env
+
+_SANDBOX_MESSAGES = {
+    "timeout": "⏱ Код выполнялся слишком долго и был остановлен",
+    "memory": "🧠 Код превысил лимит памяти и был остановлен",
+    "cancelled": "⏹ Выполнение отменено",
+}
+
+def _isolated(untrusted: bool) -> bool:
+    mode = (REPL_ISOLATION or "off").lower()
+    return mode == "all" or (mode == "templates" and untrusted)
+
+def python_repl_tool(code: str, untrusted: bool = False) -> str:
+    """
+    Исполняет автокод (# RAGOS_AUTOCODE) над df_*/G и возвращает текст ответа.
+    untrusted=True — код шаблонов (tpl_store/LLM): при REPL_ISOLATION="templates" идёт в пул процессов.
+    """
+    prof = profile.start("repl")
+    out = _run_code(code, untrusted, prof)
+    prof.finish(out)
+    return out
+
+def _run_code(code: str, untrusted: bool, prof) -> str:
+    key = _code_key(code)
+    entry = _cache_get(key)
+    logger.info("[CODE.REPL.CALL] guard=%s len=%d compiled=%s",
+                True if entry else code.strip().startswith(MAGIC), len(code), "hit" if entry else "miss")
     try:
-        code2 = _sanitize_code(code)
+        if entry is None:
+            t0 = time.perf_counter()
+            with prof.phase("prepare"):
+                entry = _prepare(code)
+            if isinstance(entry, str):
+                return entry
+            _cache_put(key, entry, (time.perf_counter() - t0) * 1000)
+        code2 = entry.source
         logger.info("[CODE.REPL.EXEC] lines=%d preview=%s", code2.count("\n")+1, code2[:200].replace("\n","⏎"))
-        if code2 == "RAISE: CSV_IO_FORBIDDEN":
-            return "🚫 Чтение CSV запрещено. Используй уже загруженные df_<ИмяСправочника>."
-
-        code2 = _patch_code(code2)
 
-        # Защитный фикс: если после MAGIC сразу идёт код без перевода строки — вставим
-        if code2.startswith(MAGIC) and not code2.startswith(MAGIC + "\n"):
-            code2 = code2.replace(MAGIC, MAGIC + "\n", 1)
-
-        env = {"pd": pd}
-        env.update(DF_ENV)
-        if G_ENV is not None:
-            env["G"] = G_ENV
-
-        exec(code2, {"__builtins__": SAFE_BUILTINS}, env)
-        result = env.get("result")
+        versions = _data_versions(entry) if REPL_RESULT_CACHE_SIZE > 0 else None
+        result = _result_get(entry.norm_key, versions) if versions is not None else _MISSING
+        cache_state = "hit" if result is not _MISSING else ("miss" if versions is not None else "off")
+        if result is _MISSING:
+            if _isolated(untrusted):
+                from engine.sandbox import get_pool
+                with prof.phase("exec"):
+                    res = get_pool().run(code2, entry.df_names, entry.uses_graph)
+                state.LastCode = code2
+                if res.status == "error":
+                    return f"Ошибка выполнения Python-кода: {res.error}"
+                if not res.ok:
+                    return _SANDBOX_MESSAGES[res.status] + (f": {res.error}." if res.error else ".")
+                result = res.result
+            else:
+                with prof.phase("exec"):
+                    env = build_env(entry.df_names)
+                    exec(entry.code, {"__builtins__": SAFE_BUILTINS}, env)
+                result = env.get("result")
+            # DataFrame/Series не кэшируем: изменяемые и могут быть большими
+            if versions is not None and not isinstance(result, (pd.DataFrame, pd.Series)):
+                _result_put(entry.norm_key, versions, result)
         state.LastCode = code2
-
-        if isinstance(result, list):
-            logger.info("[CODE.REPL.RESULT] type=list size=%d", len(result))
-        else:
-            logger.info("[CODE.REPL.RESULT] type=%s preview=%s", type(result).__name__, str(result)[:200].replace("\n","⏎"))
+        prof.result(result, cache_state)
 
         if result is None:
-            state.LastResultStr = None
+            state.LastResult = None
+            logger.info("[CODE.REPL.RESULT] type=none cache=%s", cache_state)
             return "Код выполнен, но переменная result не установлена.\n[DEBUG] Выполненный код:\n" + code2
 
-        if isinstance(result, list):
-            state.LastResultStr = str(result)
-            if len(result) > 50:
-                return f"{len(result)} элементов. Первые 50: {result[:50]}"
-            return str(result)
-
-        state.LastResultStr = str(result)
-        return str(result)
+        # Полный текст не строим: первая страница сейчас, остальное — !дальше / !экспорт
+        with prof.phase("format"):
+            res = ReplResult.wrap(result)
+            if res.paged:
+                logger.info("[CODE.REPL.RESULT] type=%s size=%d cache=%s", res.kind, res.length, cache_state)
+            else:
+                logger.info("[CODE.REPL.RESULT] type=%s preview=%s cache=%s", type(result).__name__,
+                            str(result)[:200].replace("\n","⏎"), cache_state)
+            state.LastResult = res
+            return res.preview_text()
 
     except Exception as e:
         return f"Ошибка выполнения Python-кода: {e}"
\ No newline at end of file
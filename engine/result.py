@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Результат автокода как объект, а не str(result):
+тип, длина, типизированная страница предпросмотра и курсор.
+Следующие страницы берутся из того же объекта (без повторного исполнения),
+полный текст строится только при явном экспорте (!экспорт).
+"""
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+import pandas as pd
+from config import EXPORTS_DIR, REPL_PAGE_SIZE
+
+@dataclass
+class ResultPage:
+    items: List[Any]            # значения как есть (str/int/dict-строки DataFrame), не текст
+    offset: int
+    total: Optional[int]
+    next_cursor: Optional[int]  # None — страниц больше нет
+
+    def __str__(self) -> str:
+        return str(self.items)
+
+@dataclass
+class ReplResult:
+    value: Any = field(repr=False)
+    kind: str = "scalar"        # "list" | "frame" | "series" | "dict" | "scalar" | "none"
+    length: Optional[int] = None
+    page_size: int = REPL_PAGE_SIZE
+    cursor: int = 0             # начало следующей непоказанной страницы
+
+    @classmethod
+    def wrap(cls, value: Any, page_size: int = REPL_PAGE_SIZE) -> "ReplResult":
+        if isinstance(value, pd.arrays.ArrowExtensionArray):
+            # .unique()/.values по string[pyarrow]-колонкам снимка — как ndarray у object-колонок
+            value = value.to_numpy(dtype=object)
+        if value is None:
+            kind, length = "none", None
+        elif isinstance(value, pd.DataFrame):
+            kind, length = "frame", len(value)
+        elif isinstance(value, pd.Series):
+            kind, length = "series", len(value)
+        elif isinstance(value, (list, tuple, set)):
+            kind, length = "list", len(value)
+        elif isinstance(value, dict):
+            kind, length = "dict", len(value)
+        else:
+            kind, length = "scalar", None
+        return cls(value=value, kind=kind, length=length, page_size=page_size)
+
+    @property
+    def paged(self) -> bool:
+        return self.length is not None
+
+    def page(self, cursor: Optional[int] = None, size: Optional[int] = None) -> ResultPage:
+        """Страница начиная с cursor (по умолчанию — текущий курсор); курсор сдвигается."""
+        start = self.cursor if cursor is None else max(0, int(cursor))
+        size = size or self.page_size
+        if not self.paged:
+            self.cursor = 0
+            return ResultPage([self.value], 0, None, None)
+        end = min(start + size, self.length)
+        v = self.value
+        if self.kind == "frame":
+            items = v.iloc[start:end].to_dict("records")
+        elif self.kind == "series":
+            items = v.iloc[start:end].tolist()
+        elif self.kind == "dict":
+            items = list(v.items())[start:end]
+        elif isinstance(v, set):
+            items = sorted(v, key=str)[start:end]
+        else:
+            items = list(v[start:end])
+        self.cursor = end
+        return ResultPage(items, start, self.length, end if end < self.length else None)
+
+    def preview_text(self) -> str:
+        """Текст ответа: первая страница, а не str() всего результата."""
+        if self.kind == "none":
+            return ""
+        if not self.paged or self.length <= self.page_size:
+            # Короткий результат — как раньше, целиком
+            self.cursor = self.length or 0
+            return str(self.value)
+        page = self.page(0)
+        unit = "строк" if self.kind == "frame" else "элементов"
+        return (f"{self.length} {unit}. Первые {len(page.items)}: {self._page_text(page)}\n"
+                f"(ещё: !дальше, целиком в файл: !экспорт)")
+
+    def next_page_text(self) -> str:
+        if not self.paged or self.cursor >= (self.length or 0):
+            return "ℹ Больше элементов нет."
+        page = self.page()
+        tail = "\n(ещё: !дальше)" if page.next_cursor is not None else ""
+        return f"Элементы {page.offset + 1}–{page.offset + len(page.items)} из {self.length}: {self._page_text(page)}{tail}"
+
+    def _page_text(self, page: ResultPage) -> str:
+        if self.kind == "frame":
+            return "\n" + self.value.iloc[page.offset:page.offset + len(page.items)].to_string()
+        return str(page.items)
+
+    def export(self, path: Optional[str] = None) -> str:
+        """Полный результат в файл (DataFrame/Series — CSV, остальное — по строке на элемент). Возвращает путь."""
+        if not path:
+            os.makedirs(EXPORTS_DIR, exist_ok=True)
+            ext = ".csv" if self.kind in ("frame", "series") else ".txt"
+            path = os.path.join(EXPORTS_DIR, f"result_{time.strftime('%Y%m%d_%H%M%S')}{ext}")
+        if self.kind in ("frame", "series"):
+            # у Series (value_counts и т.п.) индекс — это данные
+            self.value.to_csv(path, sep=";", index=self.kind == "series", encoding="utf-8-sig")
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                if self.kind == "list":
+                    for item in self.value:
+                        f.write(f"{item}\n")
+                elif self.kind == "dict":
+                    for k, v in self.value.items():
+                        f.write(f"{k}\t{v}\n")
+                else:
+                    f.write(f"{self.value}\n")
+        return path
+
+def handle_result_command(q: str) -> Optional[str]:
+    """!дальше — следующая страница последнего результата, !экспорт [путь] — весь результат в файл."""
+    import state
+    s = q.strip()
+    if re.match(r"!(дальше|ещё|еще)$", s, flags=re.I):
+        if state.LastResult is None:
+            return "⚠ Нет последнего результата."
+        return state.LastResult.next_page_text()
+    m = re.match(r"!экспорт(?:\s+(.+))?$", s, flags=re.I)
+    if m:
+        if state.LastResult is None:
+            return "⚠ Нет последнего результата."
+        try:
+            path = state.LastResult.export((m.group(1) or "").strip() or None)
+        except Exception as e:
+            return f"⚠ Не удалось экспортировать: {e}"
+        return f"💾 Результат сохранён: {path}"
+    return None
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import re
+from engine import profile
 from .parse import parse_structured
 from .single import (
     try_quick_count_structured as _count_single,
@@ -19,8 +20,10 @@ def try_quick_count(q: str, dfs: dict):
     entity, pairs = parsed
     if len(pairs) == 1:
         field, value = pairs[0]
-        return _count_single(entity, field, value, dfs)
-    return _count_multi(entity, pairs, dfs)
+        with profile.tagged("router:count.single"):
+            return _count_single(entity, field, value, dfs)
+    with profile.tagged("router:count.multi"):
+        return _count_multi(entity, pairs, dfs)
 
 def try_quick_list(q: str, dfs: dict):
     # Срабатывает только если явно просят список
@@ -32,5 +35,7 @@ def try_quick_list(q: str, dfs: dict):
     entity, pairs = parsed
     if len(pairs) == 1:
         field, value = pairs[0]
-        return _list_single(entity, field, value, dfs)
-    return _list_multi(entity, pairs, dfs)
\ No newline at end of file
+        with profile.tagged("router:list.single"):
+            return _list_single(entity, field, value, dfs)
+    with profile.tagged("router:list.multi"):
+        return _list_multi(entity, pairs, dfs)
\ No newline at end of file
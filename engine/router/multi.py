@@ -2,8 +2,7 @@
 from typing import List, Tuple
 from core.mappings import pick_column, suggest_similar_columns
 from .utils import suggest_values_message, suggest_cols_message, handle_value_with_fuzzy
-from engine.repl import python_repl_tool, MAGIC
-from state import LastSelection
+from engine.plan import Plan, Filter, run_plan
 import state
 
 def count_multi(entity: str, pairs: List[Tuple[str, str]], dfs: dict):
@@ -25,14 +24,12 @@ def count_multi(entity: str, pairs: List[Tuple[str, str]], dfs: dict):
                 "candidates": suggestions
             })
             return suggest_cols_message(entity, field, entity, suggestions)
-        out_tmp, notes, suggestions = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode="count")
+        out_tmp, notes, suggestions, used_val = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode=None)
         if out_tmp.startswith("⚠"):
             return out_tmp
-        used_val = LastSelection.get("value")
         resolved.append((col, used_val, notes, suggestions))
-    cond_parts = [f"({df_var}[{repr(col)}]=={repr(val)})" for col, val, *_ in resolved]
-    code = f"{MAGIC}\nresult = {df_var}[" + " & ".join(cond_parts) + "].shape[0]"
-    out = python_repl_tool(code)
+    plan = Plan(entity, tuple(Filter(col, val) for col, val, *_ in resolved), "count")
+    out = run_plan(plan, dfs)
     note_lines = []
     for _, _, notes, sugg in resolved:
         for n in notes: note_lines.append(f"- {n}")
@@ -59,14 +56,11 @@ def list_multi(entity: str, pairs: List[Tuple[str, str]], dfs: dict):
                 "candidates": suggestions
             })
             return suggest_cols_message(entity, field, entity, suggestions)
-        out_tmp, notes, suggestions = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode="list")
+        out_tmp, notes, suggestions, used_val = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode=None)
         if out_tmp.startswith("⚠"): return out_tmp
-        used_val = LastSelection.get("value")
         resolved.append((col, used_val, notes, suggestions))
-    cond_parts = [f"({df_var}[{repr(col)}]=={repr(val)})" for col, val, *_ in resolved]
-    name_col = "Наименование" if "Наименование" in df.columns else "GUID"
-    code = f"{MAGIC}\nresult = {df_var}[" + " & ".join(cond_parts) + f"][{repr(name_col)}].tolist()"
-    out = python_repl_tool(code)
+    plan = Plan(entity, tuple(Filter(col, val) for col, val, *_ in resolved), "list")
+    out = run_plan(plan, dfs)
     note_lines = []
     for _, _, notes, sugg in resolved:
         for n in notes: note_lines.append(f"- {n}")
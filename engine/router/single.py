@@ -21,7 +21,7 @@ def try_quick_count_structured(entity: str, field: str, value: str, dfs: dict):
             "candidates": suggestions
         })
         return suggest_cols_message(entity, field, entity, suggestions)
-    out, notes, suggestions = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode="count")
+    out, notes, suggestions, _ = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode="count")
     if out.startswith("⚠"):
         return out
     notes_text = ("\n" + "\n".join(f"- {n}" for n in notes)) if notes else ""
@@ -45,7 +45,7 @@ def try_quick_list_structured(entity: str, field: str, value: str, dfs: dict):
             "candidates": suggestions
         })
         return suggest_cols_message(entity, field, entity, suggestions)
-    out, notes, suggestions = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode="list")
+    out, notes, suggestions, _ = handle_value_with_fuzzy(entity, field, value, df, df_var, col, mode="list")
     if out.startswith("⚠"):
         return out
     notes_text = ("\n" + "\n".join(f"- {n}" for n in notes)) if notes else ""
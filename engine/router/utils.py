@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from core.mappings import (
     resolve_value as _resolve_val,
     suggest_similar_values as _sugg_vals,
 )
 
-# ВАЖНО: MAGIC/REPL берём из engine.repl (без кругового импорта)
-from engine.repl import python_repl_tool, MAGIC
+from engine.plan import Plan, Filter, run_plan
+from data.columns import prepared_column, exact_value
 import state
 
 def suggest_cols_message(entity: str, field: str, df_name: str, suggestions: List[Tuple[str, int]]) -> str:
@@ -40,37 +40,39 @@ def suggest_values_message(entity: str, field: str, asked_value: str, suggestion
                   f'  !запомни_значение {field} ~ "{asked_value}" = "{top_val}"']
     return "\n".join(lines)
 
+def value_plan(entity: str, column: str, value, mode: str) -> Plan:
+    """План «count/list по одному равенству» — общий для single/multi."""
+    return Plan(entity, (Filter(column, value),), "count" if mode == "count" else "list")
+
+def _run_value(entity: str, column: str, value, mode: Optional[str], df) -> str:
+    return run_plan(value_plan(entity, column, value, mode), {entity: df}) if mode else ""
+
 def handle_value_with_fuzzy(entity: str, field: str, value: str, df, df_var: str, column: str, mode: str):
     """
-    Возвращает (out_text, notes, suggestions)
+    Возвращает (out_text, notes, suggestions, used_value) — used_value: значение, по которому
+    фактически фильтруем (точное, по нормализованному ключу или лучшее нечёткое; None — не нашли).
+    mode=None — только разрешить значение, без выполнения плана (out_text пуст, если не ⚠).
     """
     notes: List[str] = []
     suggestions: List[Tuple[str, int]] = []
 
     val = _resolve_val(entity, field, value)
-    series = df[column].fillna("").astype(str)
 
-    # точное совпадение
-    if (series == str(val)).any():
-        if mode == "count":
-            code = f"{MAGIC}\nresult = {df_var}[{df_var}[{repr(column)}] == {repr(val)}].shape[0]"
-        else:
-            name_col = "Наименование" if "Наименование" in df.columns else "GUID"
-            code = f"{MAGIC}\nresult = {df_var}[{df_var}[{repr(column)}]=={repr(val)}][{repr(name_col)}].tolist()"
-        return python_repl_tool(code), notes, suggestions
+    # точное совпадение — проверка ключа в индексе значений, без прохода по колонке;
+    # затем — по нормализованному ключу (регистр, ё/е, пробелы, кавычки)
+    exact = exact_value(entity, df, column, val)
+    if exact is not None:
+        if exact != val:
+            state.update_selection(entity, df_var, field, column, exact)
+        return _run_value(entity, column, exact, mode, df), notes, suggestions, exact
 
     # fuzzy
-    suggestions = _sugg_vals(series, value, top_n=10)
+    suggestions = _sugg_vals(prepared_column(entity, column, df), value, top_n=10)
     if not suggestions:
-        return f"⚠ Не нашёл значение «{value}» для поля «{field}», и похожих значений нет.", notes, suggestions
+        return f"⚠ Не нашёл значение «{value}» для поля «{field}», и похожих значений нет.", notes, suggestions, None
 
     best_val, best_score = suggestions[0]
-    if mode == "count":
-        code = f"{MAGIC}\nresult = {df_var}[{df_var}[{repr(column)}] == {repr(best_val)}].shape[0]"
-    else:
-        name_col = "Наименование" if "Наименование" in df.columns else "GUID"
-        code = f"{MAGIC}\nresult = {df_var}[{df_var}[{repr(column)}]=={repr(best_val)}][{repr(name_col)}].tolist()"
-    out = python_repl_tool(code)
+    out = _run_value(entity, column, best_val, mode, df)
 
     state.LastSuggestion.update({
         "kind": "value",
@@ -84,4 +86,4 @@ def handle_value_with_fuzzy(entity: str, field: str, value: str, df, df_var: str
     notes.append(note)
     state.update_selection(entity, df_var, field, column, best_val)
 
-    return out, notes, suggestions
\ No newline at end of file
+    return out, notes, suggestions, best_val
\ No newline at end of file
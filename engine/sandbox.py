@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Исполнение автокода в пуле заранее поднятых процессов (REPL_ISOLATION).
+Зависший cross join или квадратичный .apply больше не морозит GUI: у каждого запуска
+есть таймаут по времени, потолок памяти и отмена — процесс просто убивается и заменяется новым.
+Данные воркер не грузит заново:
+  spawn/forkserver (по умолчанию) — открывает ленивый реестр поверх общего снимка (data/snapshot.py, mmap):
+    строки (string[pyarrow]), числа и коды категорий лежат в страницах файла, общих с родителем и
+    другими воркерами; свои у воркера — только объекты, созданные автокодом;
+  fork — наследует DF_ENV/G_ENV родителя (copy-on-write), но безопасен только до запуска потоков.
+Без снимка (USE_SNAPSHOT, pyarrow) или при SNAPSHOT_STRINGS = "object" каждый spawn/forkserver-воркер
+держит свою копию всех прочитанных сущностей — память растёт ×(REPL_WORKERS + 1), об этом пишется
+[CODE.SANDBOX.PRIVATE_FRAMES]. Лимит памяти считает только приватные страницы воркера.
+Воркер, поднятый до перезагрузки данных (data.version), перед использованием пересоздаётся.
+"""
+import os
+import sys
+import time
+import atexit
+import logging
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from config import (REPL_WORKERS, REPL_TIMEOUT_SEC, REPL_MEMORY_MB, REPL_START_METHOD, REPL_CODE_CACHE_SIZE,
+                    USE_SNAPSHOT, SNAPSHOT_STRINGS)
+from data import version
+
+logger = logging.getLogger("ragos")
+
+try:
+    import psutil
+except Exception:
+    psutil = None
+
+_POLL_SEC = 0.05
+
+@dataclass
+class ExecResult:
+    status: str                 # "ok" | "error" | "timeout" | "memory" | "cancelled"
+    result: Any = None
+    error: str = ""
+    seconds: float = 0.0
+    pid: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+# --- Воркер ---
+
+def _vm_data_kb() -> int:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmData:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def _limit_memory(memory_mb: int):
+    """RLIMIT_DATA: отображённый только на чтение снимок не считается, унаследованная куча — да.
+    На Windows resource нет — там лимит держит SandboxPool.run по приросту приватной памяти (psutil)."""
+    if not memory_mb:
+        return
+    try:
+        import resource
+        limit = (_vm_data_kb() * 1024) + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    except Exception:
+        pass
+
+def _private_bytes(pid: int) -> int:
+    """Приватная память процесса: страницы снимка (общий mmap только на чтение) не считаются."""
+    mi = psutil.Process(pid).memory_info()
+    if hasattr(mi, "private"):
+        return mi.private                       # Windows: private bytes
+    return mi.rss - getattr(mi, "shared", 0)    # Linux: shared — резидентные файловые страницы
+
+def _shares_frames() -> bool:
+    """Открывают ли spawn/forkserver-воркеры сущности поверх общего снимка, а не своей копией."""
+    from data import snapshot
+    return USE_SNAPSHOT and snapshot.AVAILABLE and SNAPSHOT_STRINGS != "object"
+
+def _bootstrap():
+    # spawn: свой интерпретатор — открываем ленивый реестр (сущности берутся из снимка при обращении)
+    from data.loader import load_dataframes
+    from engine.repl import register_dataframes
+    register_dataframes(load_dataframes(lazy=True))
+
+def _ensure_graph():
+    from engine import repl
+    if repl.G_ENV is None:
+        from graph.tool import load_graph
+        G = load_graph()
+        if G is not None:
+            repl.register_graph(G)
+
+def _worker_main(conn, memory_mb: int, bootstrap: bool):
+    _limit_memory(memory_mb)
+    if bootstrap:
+        _bootstrap()
+    from engine import repl
+    # LRU как _CODE_CACHE в engine.repl: воркер живёт долго, а автокод почти всегда разный
+    compiled: "OrderedDict[str, Any]" = OrderedDict()
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        source, df_names, uses_graph = msg
+        t0 = time.perf_counter()
+        try:
+            code = compiled.get(source)
+            if code is None:
+                code = compile(source, "<ragos-autocode>", "exec")
+                if REPL_CODE_CACHE_SIZE > 0:
+                    compiled[source] = code
+                    while len(compiled) > REPL_CODE_CACHE_SIZE:
+                        compiled.popitem(last=False)
+            else:
+                compiled.move_to_end(source)
+            if uses_graph:
+                _ensure_graph()
+            env = repl.build_env(df_names)
+            exec(code, {"__builtins__": repl.SAFE_BUILTINS}, env)
+            out = ("ok", env.get("result"), "")
+        except MemoryError:
+            out = ("memory", None, "MemoryError")
+        except Exception as e:
+            out = ("error", None, str(e))
+        try:
+            conn.send(out + (time.perf_counter() - t0,))
+        except Exception as e:
+            conn.send(("error", None, f"результат не передаётся из процесса: {e}", time.perf_counter() - t0))
+
+# --- Пул ---
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: int):
+        parent, child = ctx.Pipe()
+        bootstrap = ctx.get_start_method() != "fork"
+        self.proc = ctx.Process(target=_worker_main, args=(child, memory_mb, bootstrap),
+                                name="ragos-repl-worker", daemon=True)
+        self.proc.start()
+        child.close()
+        self.conn = parent
+        self.version = version.data_version()
+        self.ready = False
+        self.base_private = 0
+
+    def wait_ready(self, timeout: float) -> bool:
+        if not self.ready and self.conn.poll(timeout):
+            try:
+                self.conn.recv()
+                self.ready = True
+                if psutil:
+                    self.base_private = _private_bytes(self.proc.pid)
+            except Exception:
+                return False
+        return self.ready
+
+    def memory_growth_mb(self) -> float:
+        if not psutil or not self.base_private:
+            return 0.0
+        try:
+            return (_private_bytes(self.proc.pid) - self.base_private) / 1048576
+        except Exception:
+            return 0.0
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(timeout=5)
+
+class SandboxPool:
+    def __init__(self, size: int = REPL_WORKERS, timeout: float = REPL_TIMEOUT_SEC,
+                 memory_mb: int = REPL_MEMORY_MB, start_method: str = REPL_START_METHOD):
+        if start_method == "auto":
+            # fork из процесса с потоками (GUI, наблюдатель за файлами, загрузка LazyFrames) может унести
+            # в воркер захваченную блокировку — поэтому по умолчанию чистый процесс: forkserver, где есть, иначе spawn
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        self.ctx = mp.get_context(start_method)
+        self.size = max(1, int(size or 1))
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._idle: List[_Worker] = []
+        self._cond = threading.Condition()
+        self._running: Dict[int, threading.Event] = {}
+        self._closed = False
+        self.stats = {"runs": 0, "ok": 0, "error": 0, "timeout": 0, "memory": 0, "cancelled": 0, "respawns": 0}
+
+    def start(self):
+        if self.ctx.get_start_method() == "fork" and threading.active_count() > 1:
+            logger.warning("[CODE.SANDBOX.FORK_THREADS] fork при %d потоках: воркер может унаследовать "
+                           "захваченную блокировку — лучше REPL_START_METHOD=\"auto\"", threading.active_count())
+        if self.memory_mb and psutil is None and sys.platform == "win32":
+            logger.warning("[CODE.SANDBOX.NO_MEMORY_LIMIT] psutil не установлен — лимит памяти %d МБ не действует",
+                           self.memory_mb)
+        if self.ctx.get_start_method() != "fork" and not _shares_frames():
+            logger.warning("[CODE.SANDBOX.PRIVATE_FRAMES] снимок недоступен или SNAPSHOT_STRINGS=\"object\": "
+                           "каждый из %d воркеров держит свою копию данных", self.size)
+        with self._cond:
+            while len(self._idle) < self.size:
+                self._idle.append(_Worker(self.ctx, self.memory_mb))
+        logger.info("[CODE.SANDBOX.START] workers=%d method=%s", self.size, self.ctx.get_start_method())
+        return self
+
+    def _respawn_async(self):
+        def _spawn():
+            w = _Worker(self.ctx, self.memory_mb)
+            with self._cond:
+                if self._closed:
+                    w.kill()
+                    return
+                self._idle.append(w)
+                self.stats["respawns"] += 1
+                self._cond.notify()
+        threading.Thread(target=_spawn, name="ragos-repl-respawn", daemon=True).start()
+
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            while not self._idle:
+                self._cond.wait()
+            w = self._idle.pop()
+        # Данные перезагружены после старта воркера — у него старая копия
+        if w.version != version.data_version() or not w.proc.is_alive():
+            w.kill()
+            w = _Worker(self.ctx, self.memory_mb)
+            self.stats["respawns"] += 1
+        return w
+
+    def _release(self, w: _Worker):
+        with self._cond:
+            self._idle.append(w)
+            self._cond.notify()
+
+    def run(self, source: str, df_names: Tuple[str, ...] = (), uses_graph: bool = False,
+            timeout: Optional[float] = None, cancel: Optional[threading.Event] = None) -> ExecResult:
+        timeout = self.timeout if timeout is None else timeout
+        cancel = cancel or threading.Event()
+        w = self._acquire()
+        t0 = time.perf_counter()
+        self._running[id(cancel)] = cancel
+        status = None
+        try:
+            if not w.wait_ready(max(timeout, 60)):
+                status, error = "error", "воркер не запустился"
+            else:
+                w.conn.send((source, tuple(df_names), uses_graph))
+                deadline = time.perf_counter() + timeout if timeout else None
+                while True:
+                    if w.conn.poll(_POLL_SEC):
+                        status, result, error, seconds = w.conn.recv()
+                        self._release(w)
+                        return self._done(ExecResult(status, result, error, seconds, w.proc.pid))
+                    if cancel.is_set():
+                        status, error = "cancelled", ""
+                    elif deadline and time.perf_counter() > deadline:
+                        status, error = "timeout", f"превышен лимит времени {timeout:g} с"
+                    elif not w.proc.is_alive():
+                        # убит ОС (обычно — нехватка памяти)
+                        status, error = "memory", f"процесс завершился (код {w.proc.exitcode})"
+                    elif self.memory_mb and w.memory_growth_mb() > self.memory_mb:
+                        status, error = "memory", f"превышен лимит памяти {self.memory_mb} МБ"
+                    if status:
+                        break
+        except (EOFError, OSError) as e:
+            status, error = "error", f"связь с воркером потеряна: {e}"
+        except KeyboardInterrupt:
+            # Ctrl+C в консоли: воркер с недоделанным кодом убиваем, прерывание идёт дальше
+            w.kill()
+            self._respawn_async()
+            self._done(ExecResult("cancelled", None, "", time.perf_counter() - t0, w.proc.pid))
+            raise
+        finally:
+            self._running.pop(id(cancel), None)
+        pid = w.proc.pid
+        w.kill()
+        self._respawn_async()
+        return self._done(ExecResult(status, None, error, time.perf_counter() - t0, pid))
+
+    def _done(self, res: ExecResult) -> ExecResult:
+        self.stats["runs"] += 1
+        self.stats[res.status] = self.stats.get(res.status, 0) + 1
+        log = logger.info if res.ok else logger.warning
+        log("[CODE.SANDBOX.RUN] status=%s pid=%s ms=%.0f err=%s", res.status, res.pid, res.seconds * 1000, res.error)
+        return res
+
+    def cancel_all(self):
+        """Прервать все текущие запуски (воркеры будут убиты и заменены)."""
+        for ev in list(self._running.values()):
+            ev.set()
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for w in idle:
+            try:
+                w.conn.send(None)
+            except Exception:
+                pass
+            w.kill()
+
+_POOL: Optional[SandboxPool] = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool() -> SandboxPool:
+    """Общий пул (создаётся и прогревается при первом обращении)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = SandboxPool().start()
+            atexit.register(_POOL.shutdown)
+        return _POOL
+
+def cancel_all() -> bool:
+    """Прервать текущие запуски автокода; False — пул не запущен (REPL_ISOLATION="off")."""
+    if _POOL is None:
+        return False
+    _POOL.cancel_all()
+    return True
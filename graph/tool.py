@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
-import os, pickle, re
+import os, pickle, re, weakref
+import numpy as np
 from rapidfuzz import fuzz
-from config import GRAPH_PATH, log
+from config import GRAPH_PATH, FUZZY_NGRAM_MIN_CHOICES, log
+from data import version
+from data.guid import to_str
+from data.ngrams import TrigramIndex
 
 def load_graph():
     if os.path.exists(GRAPH_PATH):
@@ -11,6 +15,29 @@ def load_graph():
         return G
     return None
 
+# Имена узлов для нечёткого поиска: (версия графа, weakref на граф, узлы, имена, типы, триграммы)
+_NAMES = None
+
+def _name_index(G):
+    """Узлы с непустым именем, их имена, типы (lower) и триграммный индекс (для больших графов)."""
+    global _NAMES
+    ver = version.entity_version(version.GRAPH_KEY)
+    if _NAMES is not None and _NAMES[0] == ver and _NAMES[1]() is G:
+        return _NAMES[2:]
+    nodes, names, types = [], [], []
+    for n, data in G.nodes(data=True):
+        name = data.get("name") or data.get("attrs", {}).get("Наименование") or ""
+        if not name:
+            continue
+        nodes.append(n)
+        names.append(str(name))
+        types.append(str(data.get("type", "")).lower())
+    tri = None
+    if FUZZY_NGRAM_MIN_CHOICES and len(names) >= FUZZY_NGRAM_MIN_CHOICES:
+        tri = TrigramIndex([x.casefold() for x in names])
+    _NAMES = (ver, weakref.ref(G), nodes, names, np.array(types, dtype=object), tri)
+    return _NAMES[2:]
+
 def graph_query(query: str, G) -> str:
     if G is None:
         return "⚠ Граф не загружен."
@@ -22,15 +49,22 @@ def graph_query(query: str, G) -> str:
     m_type = re.search(r'граф\s+([A-Za-zА-Яа-яЁё0-9_.-]+)\s+[\"«]', query, flags=re.I)
     type_filter = m_type.group(1).strip() if m_type else None
 
+    nodes, names, types, tri = _name_index(G)
+    rows = range(len(nodes))
+    want = type_filter.lower() if type_filter else None
+    if tri is not None:
+        # большой граф: WRatio только по узлам с наибольшим числом общих триграмм
+        cand = tri.candidates(target.casefold(), allowed=(types == want) if want else None)
+        if cand is not None:
+            rows = cand
     candidates = []
-    for n, data in G.nodes(data=True):
-        if type_filter and str(data.get("type", "")).lower() != type_filter.lower():
-            continue
-        name = data.get("name") or data.get("attrs", {}).get("Наименование") or ""
-        if not name:
+    for i in rows:
+        if want and types[i] != want:
             continue
+        n, name = nodes[i], names[i]
         score = fuzz.WRatio(target, name)
         if score >= 80:
+            data = G.nodes[n]
             candidates.append((n, name, data.get("type", "?"), data.get("meta", ""), score))
     if not candidates:
         return f"⚠ Объект близкий к «{target}» не найден."
@@ -40,7 +74,7 @@ def graph_query(query: str, G) -> str:
     examples = [G.nodes[p].get("name") or G.nodes[p].get("attrs", {}).get("Наименование", "?") for p in projects[:10]]
     meta_str = f" | meta: {node_meta}" if node_meta else ""
     return (
-        f"Найден: {node_name} [{node_type}]{meta_str} (GUID: {node})\n"
+        f"Найден: {node_name} [{node_type}]{meta_str} (GUID: {to_str(node)})\n"
         f"Связанных проектов: {len(projects)}\n"
         f"Примеры: {', '.join(examples) if examples else '—'}"
     )
\ No newline at end of file
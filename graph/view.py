@@ -25,6 +25,7 @@ except ImportError:
     sys.exit(1)
 
 from config import GRAPH_PATH
+from data.guid import to_str
 import random
 
 # Предопределённые цвета
@@ -63,21 +64,23 @@ def preview_graph(G, max_nodes=None, out_file="graph_preview.html"):
     for n, data in H.nodes(data=True):
         t = data.get("type", "default")
         name = data.get("name") or ""
-        short_id = str(n)[:6]
+        # Ключ узла — 128-битный int (или строка в графах старого формата); pyvis/JS нужен строковый id
+        guid = to_str(n)
+        short_id = guid[:6]
 
         label = name if name else short_id
         label += f"\n<b>{t}</b>"
 
-        title = f"<b>GUID:</b> {n}<br><b>Тип:</b> {t}<br><b>Имя:</b> {name or '—'}"
+        title = f"<b>GUID:</b> {guid}<br><b>Тип:</b> {t}<br><b>Имя:</b> {name or '—'}"
 
         color = get_color_for_type(t)
         size = 8 + 2 * H.degree(n)
 
-        net.add_node(n, label=label, title=title, color=color, size=size, font={"multi": True})
+        net.add_node(guid, label=label, title=title, color=color, size=size, font={"multi": True})
 
     for u, v, data in H.edges(data=True):
         if data.get("direction") == "forward":
-            net.add_edge(u, v, title=data.get("relation", ""))
+            net.add_edge(to_str(u), to_str(v), title=data.get("relation", ""))
 
     net.write_html(out_file, open_browser=True)
     print(f"✅ Визуализация создана: {out_file}")
@@ -15,7 +15,8 @@ ChatHistory: list[dict] = []
 LastQuestion: Optional[str] = None
 LastAnswer: Optional[str] = None
 LastCode: Optional[str] = None
-LastResultStr: Optional[str] = None
+# Последний результат автокода (engine.result.ReplResult): страницы и экспорт без повторного исполнения
+LastResult: Optional[Any] = None
 
 # Последняя подсказка (колонки или значения)
 LastSuggestion = {
@@ -13,7 +13,9 @@ from core.mappings import (
 )
 from core.mappings.values import resolve_value as vm_resolve_value, suggest_similar_values
 from core.schema import get_ref_dict
-from engine.repl import python_repl_tool, MAGIC
+from engine.plan import Plan, Filter, run_plan
+from data.columns import exact_value
+from engine import profile
 from config import TEMPLATES_FILE
 
 def _ensure_templates_file():
@@ -99,17 +101,11 @@ def run_template_obj(t: Dict[str, Any], params: Dict[str, Any], dfs: Dict[str, p
         col = pick_column(df, field)
         if not col:
             return f"⚠ В {entity} не найдена колонка для поля «{field}»"
-        # мэппинг значений глобально по справочнику
+        # мэппинг значений глобально по справочнику; затем — то же значение с точностью до регистра/ё/кавычек
         used = vm_resolve_value(entity, field, value)
+        used = exact_value(entity, df, col, used) or used
         pairs.append((col, used, field, value))
 
-    # 3) mask
-    if pairs:
-        cond = " & ".join([f"(df_{entity}[{repr(col)}]=={repr(val)})" for col, val, *_ in pairs])
-        df_expr = f"df_{entity}[{cond}]"
-    else:
-        df_expr = f"df_{entity}"
-
     op = t.get("operation","").lower()
     list_field = t.get("list_field","Наименование")
     # list target column
@@ -119,15 +115,14 @@ def run_template_obj(t: Dict[str, Any], params: Dict[str, Any], dfs: Dict[str, p
     else:
         lcol = "Наименование" if "Наименование" in df.columns else "GUID"
 
-    if op == "count":
-        code = f"{MAGIC}\nresult = {df_expr}.shape[0]"
-    elif op == "list":
-        code = f"{MAGIC}\nresult = {df_expr}[{repr(lcol)}].tolist()"
-    else:
+    if op not in ("count", "list"):
         return f"⚠ Неизвестная операция: {op}"
 
-    # 4) run
-    out = python_repl_tool(code)
+    # 3) план: фильтры → проекция → агрегат; 4) run
+    plan = Plan(entity, tuple(Filter(col, val) for col, val, *_ in pairs), op,
+                lcol if op == "list" else None)
+    with profile.tagged(f"dsl:{t.get('name','<без имени>')}"):
+        out = run_plan(plan, dfs)
 
     # 5) пояснения (ref_dict)
     notes = []
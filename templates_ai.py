@@ -3,13 +3,16 @@ from __future__ import annotations
 from typing import Dict, Any, Tuple, Optional, List
 import re
 
-from core.mappings import pick_column, resolve_value_info as vm_resolve_info, suggest_similar_values as vm_suggest_vals
+from core.mappings import pick_column, resolve_value_info as vm_resolve_info, suggest_similar_values_batch as vm_suggest_vals_batch
 import state
 from templates_store import (
     list_templates, get_template, match_by_regex,
     render_code, run_template, lookup_alias, lookup_alias_with_values  
 )
 from llm_qwen import chat_json
+from data.registry import frame_columns
+from engine.analysis import validate_frames
+from data.columns import prepared_column, exact_value
 import logging
 logger = logging.getLogger("ragos")
 
@@ -58,6 +61,8 @@ def _resolve_params_with_mappings(tpl: dict, params_in: Dict[str, Any], dfs: Dic
         values = raw if isinstance(raw, list) else [raw]
         resolved_vals = []
 
+        # 1-2) алиас и точное попадание; промахи собираем, чтобы fuzzy посчитать одним вызовом
+        misses: List[int] = []
         for asked in values:
             asked_s = str(asked)
 
@@ -65,23 +70,26 @@ def _resolve_params_with_mappings(tpl: dict, params_in: Dict[str, Any], dfs: Dic
             canon, origin, bucket = vm_resolve_info(entity, field, asked_s)
             logger.info("[VAL.MAP] entity=%s field=%s asked=%s -> canon=%s origin=%s bucket=%s", entity, field, asked_s, canon, origin, bucket)
 
-            ser = df[col].fillna("").astype(str)
-
-            # 2) точное попадание
-            if (ser == str(canon)).any():
+            # 2) точное попадание (O(1) по индексу значений) или по нормализованному ключу
+            exact = exact_value(entity, df, col, canon)
+            if exact is not None:
                 logger.info("[VAL.EXACT] match in column=%s", col)
-                resolved_vals.append(canon); continue
-
-            # 3) fuzzy (top-10)
-            suggestions = vm_suggest_vals(ser, asked_s, top_n=10)
+                resolved_vals.append(exact)
+            else:
+                misses.append(len(resolved_vals))
+                resolved_vals.append(canon)
+
+        # 3) fuzzy (top-10) — все промахи списка одним пакетом
+        asked_misses = [str(values[i]) for i in misses]
+        batch = vm_suggest_vals_batch(prepared_column(entity, col, df), asked_misses, top_n=10) if misses else []
+        for i, asked_s, suggestions in zip(misses, asked_misses, batch):
             if not suggestions:
                 logger.warning("[VAL.NOT_FOUND] entity=%s field=%s asked=%s", entity, field, asked_s)
-                resolved_vals.append(canon)  # оставим как есть, результат будет 0
-                continue
+                continue  # оставим как есть, результат будет 0
 
             best_val, best_score = suggestions[0]
             logger.info("[VAL.FUZZY] entity=%s field=%s asked=%s -> used=%s score=%s candidates=%d", entity, field, asked_s, best_val, best_score, len(suggestions))
-            resolved_vals.append(best_val)
+            resolved_vals[i] = best_val
             notes.append(f'- по полю «{field}»: нет точного «{asked_s}», **использую ближайшее** «{best_val}» ({best_score}%)')
 
             # Один раз формируем подсказку и показываем кнопку
@@ -104,26 +112,18 @@ def _resolve_params_with_mappings(tpl: dict, params_in: Dict[str, Any], dfs: Dic
 
 def df_schema_brief(dfs: Dict[str, Any]) -> str:
     lines=[]
-    for name, df in dfs.items():
+    for name in dfs:
         try:
-            cols = ", ".join(list(df.columns)[:40])
+            # Заголовки без загрузки данных (ленивый реестр)
+            cols = ", ".join(frame_columns(dfs, name)[:40])
         except Exception:
             cols = ""
         lines.append(f"df_{name}: {cols}")
     return "\n".join(lines)
 
 def validate_code_uses_existing(dfs: Dict[str, Any], code: str) -> Tuple[bool, str]:
-    # 1) проверим датафреймы df_<Имя>
-    used_dfs = set(re.findall(r"\bdf_([A-Za-zА-Яа-я0-9_]+)\b", code))
-    for ent in used_dfs:
-        if ent not in dfs:
-            return False, f"⚠ В коде используется неизвестный датафрейм df_{ent}"
-    # 2) мягкая проверка колонок: только явные литералы в df_Имя['Колонка'] / ["Колонка"]
-    for m in re.finditer(r"df_([A-Za-zА-Яа-я0-9_]+)\s*```math\s*[\"']([^\"']+)[\"']\s*```", code):
-        ent, col = m.group(1), m.group(2)
-        if ent in dfs and col not in dfs[ent].columns:
-            return False, f"⚠ В df_{ent} не найдена колонка «{col}»"
-    return True, ""
+    # Один разбор AST на уникальный код: запрещённые конструкции, df_<Имя> и литеральные колонки df_Имя['Колонка']
+    return validate_frames(dfs, code)
 
 # --- LLM мэппинг параметров ---
 
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import json, os, re
+import ast, json, os, re
 from typing import Dict, List, Tuple, Any
 from rapidfuzz import fuzz
-from config import TPL_STORE_FILE
+from config import TPL_STORE_FILE, COUNT_TABLES
 from engine.repl import MAGIC, python_repl_tool
+from engine.result import ReplResult
+from engine import profile
+from data.index import get_index
+import state
 import logging
 
 _PATTERNS: list[dict] = []
@@ -272,6 +276,153 @@ def render_code(code_template: str, params: Dict[str, Any]) -> str:
         body = f"{MAGIC}\n" + body
     return body
 
+# --- Count-шаблоны: ответ по частотам индекса значений (data.index) без исполнения кода ---
+
+_SENTINEL = "\x00ragos-param\x00"
+_COUNT_SHAPES: Dict[Tuple[str, str], Any] = {}
+
+def _const_str(node) -> str | None:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+def _column_choice(node, df_var: str):
+    """
+    'A' или 'A' if 'A' in df_X.columns else 'B' → [('A', True|None), ('B', None)]:
+    пары (колонка, нужна ли проверка наличия). None — выражение не распознано.
+    """
+    if _const_str(node) is not None:
+        return [(node.value, False)]
+    if isinstance(node, ast.IfExp):
+        t = node.test
+        ok = (isinstance(t, ast.Compare) and len(t.ops) == 1 and isinstance(t.ops[0], ast.In)
+              and _const_str(t.left) is not None and _const_str(node.body) == t.left.value
+              and isinstance(t.comparators[0], ast.Attribute) and t.comparators[0].attr == "columns"
+              and isinstance(t.comparators[0].value, ast.Name) and t.comparators[0].value.id == df_var)
+        rest = _column_choice(node.orelse, df_var)
+        if ok and rest is not None:
+            return [(node.body.value, True)] + rest
+    return None
+
+def _count_shape(tpl: Dict[str, Any]):
+    """
+    Распознаёт шаблон вида
+        col = 'X_Наименование' if 'X_Наименование' in df_E.columns else 'X'
+        result = df_E[df_E[col] == {param}].shape[0]      (или len(...))
+    Возвращает (entity, param, варианты колонки) или None. Результат кэшируется по id и тексту кода.
+    """
+    key = (str(tpl.get("id")), str(tpl.get("code_template")))
+    if key in _COUNT_SHAPES:
+        return _COUNT_SHAPES[key]
+    shape = None
+    bindings = tpl.get("bindings") or {}
+    params = tpl.get("params") or []
+    if len(params) == 1 and params[0] in bindings:
+        try:
+            tree = ast.parse(render_code(tpl["code_template"], {params[0]: _SENTINEL}))
+        except Exception:
+            tree = None
+        shape = _match_count(tree, bindings[params[0]].get("entity"), params[0]) if tree else None
+    _COUNT_SHAPES[key] = shape
+    return shape
+
+def _match_count(tree, entity: str | None, param: str):
+    if not entity or not tree.body:
+        return None
+    df_var = f"df_{entity}"
+    names: Dict[str, Any] = {}
+    for st in tree.body[:-1]:
+        if not (isinstance(st, ast.Assign) and len(st.targets) == 1 and isinstance(st.targets[0], ast.Name)):
+            return None
+        choice = _column_choice(st.value, df_var)
+        if choice is None:
+            return None
+        names[st.targets[0].id] = choice
+    last = tree.body[-1]
+    if not (isinstance(last, ast.Assign) and len(last.targets) == 1
+            and isinstance(last.targets[0], ast.Name) and last.targets[0].id == "result"):
+        return None
+    v = last.value
+    if (isinstance(v, ast.Subscript) and isinstance(v.value, ast.Attribute) and v.value.attr == "shape"
+            and isinstance(v.slice, ast.Constant) and v.slice.value == 0):
+        frame = v.value.value
+    elif (isinstance(v, ast.Call) and isinstance(v.func, ast.Name) and v.func.id == "len" and len(v.args) == 1):
+        frame = v.args[0]
+    else:
+        return None
+    if not (isinstance(frame, ast.Subscript) and isinstance(frame.value, ast.Name) and frame.value.id == df_var):
+        return None
+    cmp = frame.slice
+    if not (isinstance(cmp, ast.Compare) and len(cmp.ops) == 1 and isinstance(cmp.ops[0], ast.Eq)):
+        return None
+    left, right = cmp.left, cmp.comparators[0]
+    if _const_str(left) == _SENTINEL:
+        left, right = right, left
+    if _const_str(right) != _SENTINEL:
+        return None
+    if not (isinstance(left, ast.Subscript) and isinstance(left.value, ast.Name) and left.value.id == df_var):
+        return None
+    col = left.slice
+    choice = names.get(col.id) if isinstance(col, ast.Name) else _column_choice(col, df_var)
+    return (entity, param, choice) if choice else None
+
+def _resolve_choice(choice, columns) -> str | None:
+    for col, check in choice:
+        if not check or col in columns:
+            return col
+    return None
+
+def _count_from_table(tpl: Dict[str, Any], params: Dict[str, Any]) -> str | None:
+    """Ответ count-шаблона по частотам индекса значений (data.index); None — шаблон не подходит (исполняем код)."""
+    shape = _count_shape(tpl)
+    if not shape:
+        return None
+    entity, param, choice = shape
+    value = params.get(param)
+    if not isinstance(value, str):
+        return None
+    from engine import repl
+    df_var = f"df_{entity}"
+    if df_var not in repl.DF_ENV:
+        return None
+    df = repl.DF_ENV[df_var]
+    col = _resolve_choice(choice, df.columns)
+    if col is None or col not in df.columns:
+        return None
+    idx = get_index(entity, col, df)
+    if idx is None:
+        return None
+    prof = profile.start("count_table")
+    n = idx.count(value)
+    prof.result(n, "index")
+    logger.info("[TPL.COUNT_TABLE] tpl=%s entity=%s column=%s value=%s count=%d",
+                tpl.get("id"), entity, col, value, n)
+    state.LastCode = f"{df_var}[{col!r}] == {value!r} → индекс значений ({len(idx.uniques)} значений)"
+    state.LastResult = ReplResult.wrap(n)
+    prof.finish(str(n))
+    return str(n)
+
+def warm_count_tables(dfs) -> int:
+    """Строит индексы значений для колонок count-шаблонов по уже загруженным сущностям (ленивые не трогаем)."""
+    built = 0
+    for tpl in list_templates():
+        shape = _count_shape(tpl)
+        if not shape:
+            continue
+        entity = shape[0]
+        if entity not in dfs or (hasattr(dfs, "is_loaded") and not dfs.is_loaded(entity)):
+            continue
+        df = dfs[entity]
+        col = _resolve_choice(shape[2], df.columns)
+        if col in df.columns and get_index(entity, col, df) is not None:
+            built += 1
+    return built
+
 def run_template(tpl: Dict[str, Any], params: Dict[str, Any]) -> str:
+    if COUNT_TABLES:
+        with profile.tagged(f"tpl:{tpl.get('id')}"):
+            out = _count_from_table(tpl, params)
+        if out is not None:
+            return out
     code = render_code(tpl["code_template"], params)
-    return python_repl_tool(code)
\ No newline at end of file
+    # Код шаблона написан LLM/пользователем — при REPL_ISOLATION="templates" исполняется в пуле процессов
+    with profile.tagged(f"tpl:{tpl.get('id')}"):
+        return python_repl_tool(code, untrusted=True)
\ No newline at end of file